@@ -14,8 +14,15 @@ from geoalchemy2 import load_spatialite_gpkg, load_spatialite
 from sqlalchemy.event import listen
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
 import os
+import json
+import time
+import threading
+from decimal import Decimal
 from contextlib import contextmanager
+import shapely
+import numpy as np
 
 import logging
 logger = logging.getLogger(__name__)
@@ -80,6 +87,70 @@ class GeoInfo:
         return f"{self.type}, {self.srid}, DIM={self.dimension}, IDX={self.has_index}"
     
 
+class HyperLogLog():
+    """
+    A HyperLogLog distinct count estimator with numpy registers.
+
+    Memory is fixed to 2^precision bytes, regardless of the number of values added.
+    """
+    def __init__(self, precision:int=14):
+        if precision < 4 or precision > 18:
+            raise Exception("The precision has to be between 4 and 18.")
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    @staticmethod
+    def hashValues(values) -> np.ndarray:
+        """Hash a list or array of values to well mixed uint64 hashes.
+
+        Numbers are hashed from their float64 bits, other values through python's hash.
+        """
+        array = np.asarray(values) if not isinstance(values, np.ndarray) else values
+        if array.dtype.kind in "iufb":
+            hashes = array.astype(np.float64).view(np.uint64)
+        else:
+            hashes = np.fromiter((hash(v) for v in values), dtype=np.int64, count=len(values)).view(np.uint64)
+        # splitmix64 finalizer, uint64 arithmetic wraps around
+        hashes = hashes + np.uint64(0x9E3779B97F4A7C15)
+        hashes = (hashes ^ (hashes >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        hashes = (hashes ^ (hashes >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return hashes ^ (hashes >> np.uint64(31))
+
+    def add(self, values) -> None:
+        """Add a list or array of values."""
+        if len(values) == 0:
+            return
+        self.addHashes(HyperLogLog.hashValues(values))
+
+    def addHashes(self, hashes:np.ndarray) -> None:
+        """Add already hashed uint64 values."""
+        p = np.uint64(self.precision)
+        indexes = (hashes >> (np.uint64(64) - p)).astype(np.intp)
+        # the remaining bits, with a guard bit so that the rank is bounded
+        rest = (hashes << p) | (np.uint64(1) << (p - np.uint64(1)))
+        leadingZeros = np.zeros(len(rest), dtype=np.uint8)
+        for shift in (32, 16, 8, 4, 2, 1):
+            mask = (rest >> np.uint64(64 - shift)) == 0
+            leadingZeros[mask] += shift
+            rest[mask] <<= np.uint64(shift)
+        np.maximum.at(self.registers, indexes, leadingZeros + 1)
+
+    def merge(self, other:'HyperLogLog') -> None:
+        """Merge another estimator with the same precision into this one."""
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def count(self) -> int:
+        """Get the estimated number of distinct values."""
+        m = float(len(self.registers))
+        alpha = 0.7213 / (1.0 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.exp2(-self.registers.astype(np.float64)))
+        zeros = np.count_nonzero(self.registers == 0)
+        if estimate <= 2.5 * m and zeros > 0:
+            # small range correction (linear counting)
+            estimate = m * np.log(m / zeros)
+        return int(round(estimate))
+
+
 class ADb(ABC):
     def __init__(self, url, encoding=None, echo=True):
         self.supportsSchema = True
@@ -266,6 +337,186 @@ class ADb(ABC):
                     continue
                 raise
 
+
+    def getTableStats(self, table_name, columns:list[str]=None, geometryColumn:str=None, chunk_size:int=10000) -> dict:
+        """Compute column statistics and the layer extent of a table in one streamed pass.
+
+        For every column the non null count, null count, min, max and an estimate of the
+        distinct values (HyperLogLog) are computed chunk by chunk, so memory is bounded
+        regardless of the table size. Min and max are not computed for binary and geometry columns.
+
+        The extent is taken from the database metadata when available (gpkg_contents or
+        the R-tree on geopackages, ST_EstimatedExtent on PostGIS), else it is computed
+        from the geometries while streaming.
+
+            {
+                "count": 1000,
+                "columns": {"name": {"count": 998, "nulls": 2, "min": "A", "max": "Z", "distinct": 26}, ...},
+                "extent": [xmin, ymin, xmax, ymax]
+            }
+
+        :param table_name: the table to compute the statistics of.
+        :param columns: optional list of columns to consider, defaults to all.
+        :param geometryColumn: the geometry column, if it can't be detected by reflection.
+        :param chunk_size: number of rows per chunk.
+        :return: the statistics dictionary.
+        """
+        with self.engine.connect() as conn:
+            schema, table = self._split_schema_table(conn, table_name)
+            dbColumns = [DbColumn(**c) for c in inspect(conn).get_columns(table, schema=schema)]
+            if not geometryColumn:
+                geometryColumn = next((c.name for c in dbColumns if c.geoinfo), None)
+            extent = None
+            if geometryColumn:
+                extent = self._getLayerExtent(conn, schema, table, geometryColumn)
+
+        if columns is None:
+            columns = [c.name for c in dbColumns]
+        selectColumns = list(columns)
+        geometryIndex = None
+        if geometryColumn and extent is None:
+            if geometryColumn not in selectColumns:
+                selectColumns.append(geometryColumn)
+            geometryIndex = selectColumns.index(geometryColumn)
+
+        count = 0
+        stats = {}
+        estimators = {}
+        for column in columns:
+            stats[column] = {"count": 0, "nulls": 0, "min": None, "max": None, "distinct": 0}
+            estimators[column] = HyperLogLog()
+        bounds = np.full(4, np.nan)
+
+        sql = f"SELECT {', '.join(self._q(c) for c in selectColumns)} FROM {self._q(schema)}.{self._q(table)}"
+        with self._connect_streaming() as conn:
+            cursor = conn.exec_driver_sql(sql)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                count += len(rows)
+                chunkColumns = list(zip(*rows))
+                for column, values in zip(columns, chunkColumns):
+                    columnStats = stats[column]
+                    nonNull = [v for v in values if v is not None]
+                    columnStats["count"] += len(nonNull)
+                    columnStats["nulls"] += len(values) - len(nonNull)
+                    if not nonNull:
+                        continue
+                    if isinstance(nonNull[0], (bytes, bytearray, memoryview)) or column == geometryColumn:
+                        estimators[column].add([bytes(v) if isinstance(v, memoryview) else v for v in nonNull])
+                        continue
+                    array = np.asarray(nonNull) if not isinstance(nonNull[0], (tuple, list, dict)) else None
+                    if array is not None and array.dtype.kind in "iufb":
+                        chunkMin, chunkMax = array.min().item(), array.max().item()
+                        estimators[column].add(array)
+                    else:
+                        try:
+                            chunkMin, chunkMax = min(nonNull), max(nonNull)
+                        except TypeError:
+                            chunkMin = chunkMax = None
+                        estimators[column].add([v if not isinstance(v, (list, dict)) else str(v) for v in nonNull])
+                    if chunkMin is not None:
+                        if columnStats["min"] is None or chunkMin < columnStats["min"]:
+                            columnStats["min"] = chunkMin
+                        if columnStats["max"] is None or chunkMax > columnStats["max"]:
+                            columnStats["max"] = chunkMax
+                if geometryIndex is not None:
+                    geoms = shapely.from_wkb([_geometryBlobToWkb(v) for v in chunkColumns[geometryIndex]], on_invalid="ignore")
+                    chunkBounds = shapely.bounds(geoms)
+                    if not np.all(np.isnan(chunkBounds)):
+                        bounds = np.concatenate([
+                            np.fmin(bounds[:2], np.nanmin(chunkBounds[:, :2], axis=0)),
+                            np.fmax(bounds[2:], np.nanmax(chunkBounds[:, 2:], axis=0)),
+                        ])
+
+        for column in columns:
+            stats[column]["distinct"] = min(estimators[column].count(), stats[column]["count"])
+        if extent is None and geometryIndex is not None and not np.isnan(bounds[0]):
+            extent = bounds.tolist()
+        return {"count": count, "columns": stats, "extent": extent}
+
+    def _getLayerExtent(self, conn, schema:str, table:str, geometryColumn:str) -> list[float]:
+        """Get the extent of a spatial table from the database metadata, if available.
+
+        :return: the extent as [xmin, ymin, xmax, ymax] or None.
+        """
+        return None
+
+    def getTableSample(self, table_name, fraction:float=None, n:int=None, seed:int=None, columnar:bool=False):
+        """Return a random sample of the rows of a table.
+
+        Either a fraction of the table or a number of rows can be requested. On sqlite based
+        databases random rowids are drawn from the rowid range and fetched by rowid, so the cost
+        depends on the sample size, not on the table size. With gaps in the rowids (deleted rows)
+        a fraction sample returns proportionally less rows.
+
+        :param table_name: the table to sample (views have no rowid and are not supported).
+        :param fraction: the fraction of rows to sample (0-1).
+        :param n: the number of rows to sample.
+        :param seed: optional seed to get a repeatable sample.
+        :param columnar: if True, return a dictionary of column names and numpy arrays instead of rows.
+        :return: the list of rows or the columnar dictionary.
+        """
+        if (fraction is None) == (n is None):
+            raise Exception("Either fraction or n has to be given.")
+        rng = np.random.default_rng(seed)
+        with self.engine.connect() as conn:
+            schema, table = self._split_schema_table(conn, table_name)
+            fullTable = f"{self._q(schema)}.{self._q(table)}"
+            minId, maxId = conn.exec_driver_sql(f"SELECT min(rowid), max(rowid) FROM {fullTable}").first()
+            if minId is None:
+                result = conn.exec_driver_sql(f"SELECT * FROM {fullTable} LIMIT 0")
+                return self._toColumnar(result.keys(), []) if columnar else []
+            idRange = maxId - minId + 1
+            if n is None:
+                n = int(round(fraction * idRange))
+                maxAttempts = 1
+            else:
+                maxAttempts = 5
+            n = min(n, idRange)
+
+            rows = []
+            keys = None
+            triedIds = np.empty(0, dtype=np.int64)
+            attempts = 0
+            while len(rows) < n and attempts < maxAttempts and len(triedIds) < idRange:
+                attempts += 1
+                missing = n - len(rows)
+                size = min(idRange - len(triedIds), missing if attempts == 1 else 2 * missing)
+                ids = rng.choice(idRange, size=min(idRange, size + len(triedIds)), replace=False) + minId
+                ids = np.sort(ids[~np.isin(ids, triedIds)][:size])
+                triedIds = np.union1d(triedIds, ids)
+                # keep below the sqlite bound variables limit
+                for i in range(0, len(ids), 500):
+                    batch = ids[i:i + 500].tolist()
+                    result = conn.exec_driver_sql(f"SELECT * FROM {fullTable} WHERE rowid IN ({', '.join(['?'] * len(batch))})", tuple(batch))
+                    keys = result.keys()
+                    rows.extend(result.fetchall())
+            rows = rows[:n]
+            if columnar:
+                if keys is None:
+                    keys = conn.exec_driver_sql(f"SELECT * FROM {fullTable} LIMIT 0").keys()
+                return self._toColumnar(keys, rows)
+            return rows
+
+    def _toColumnar(self, keys, rows) -> dict:
+        """Convert rows to a dictionary of column names and numpy arrays."""
+        keys = list(keys)
+        if not rows:
+            return {key: np.empty(0, dtype=object) for key in keys}
+        columns = list(zip(*rows))
+        columnar = {}
+        for key, values in zip(keys, columns):
+            try:
+                array = np.asarray(values)
+                if array.ndim != 1:
+                    raise ValueError()
+            except ValueError:
+                array = np.empty(len(values), dtype=object)
+                array[:] = values
+            columnar[key] = array
+        return columnar
     
     def getRecordCount(self, table_name) -> int:
         """Return the count of the records of a table.
@@ -361,6 +612,68 @@ class PostgresDb(ADb):
             "SELECT VERSION() as pgversion, PostGIS_Full_Version() as pgisversion;")
         return [res.pgversion, res.pgisversion]
 
+    def _getLayerExtent(self, conn, schema:str, table:str, geometryColumn:str) -> list[float]:
+        sql = "SELECT ST_XMin(e), ST_YMin(e), ST_XMax(e), ST_YMax(e) FROM (SELECT ST_EstimatedExtent(%(s)s, %(t)s, %(g)s) AS e) AS ext"
+        try:
+            row = conn.exec_driver_sql(sql, {"s": schema, "t": table, "g": geometryColumn}).first()
+        except Exception:
+            # no statistics available for the table
+            conn.rollback()
+            return None
+        if row and None not in row:
+            return [row[0], row[1], row[2], row[3]]
+        return None
+
+    def getTableSample(self, table_name, fraction:float=None, n:int=None, seed:int=None, columnar:bool=False, method:str="SYSTEM"):
+        """Return a random sample of the rows of a table using TABLESAMPLE.
+
+        For a number of rows the sampling percentage is derived from the planner row estimate,
+        slightly oversampled and then reduced to n random rows.
+
+        :param table_name: the table to sample.
+        :param fraction: the fraction of rows to sample (0-1).
+        :param n: the number of rows to sample.
+        :param seed: optional seed to get a repeatable sample (REPEATABLE clause).
+        :param columnar: if True, return a dictionary of column names and numpy arrays instead of rows.
+        :param method: SYSTEM (block sampling, fastest) or BERNOULLI (row sampling, less clustered).
+        :return: the list of rows or the columnar dictionary.
+        """
+        if (fraction is None) == (n is None):
+            raise Exception("Either fraction or n has to be given.")
+        method = method.upper()
+        if method not in ("SYSTEM", "BERNOULLI"):
+            raise Exception(f"Unsupported sampling method: {method}")
+        with self.engine.connect() as conn:
+            schema, table = self._split_schema_table(conn, table_name)
+            fullTable = f"{self._q(schema)}.{self._q(table)}"
+            if n is not None:
+                estimate = conn.exec_driver_sql("SELECT reltuples FROM pg_class WHERE oid = %(t)s::regclass", {"t": fullTable}).scalar()
+                if not estimate or estimate <= 0:
+                    estimate = conn.exec_driver_sql(f"SELECT count(*) FROM {fullTable}").scalar()
+                percent = 100.0 if not estimate else min(100.0, 150.0 * n / estimate)
+            else:
+                percent = min(100.0, 100.0 * fraction)
+
+            while True:
+                sql = f"SELECT * FROM {fullTable} TABLESAMPLE {method} ({percent})"
+                if seed is not None:
+                    sql += f" REPEATABLE ({int(seed)})"
+                result = conn.exec_driver_sql(sql)
+                keys = result.keys()
+                rows = result.fetchall()
+                if n is None or len(rows) >= n or percent >= 100.0:
+                    break
+                percent = min(100.0, percent * 2)
+
+            if n is not None and len(rows) > n:
+                # reduce to n rows without favouring the first sampled blocks
+                rng = np.random.default_rng(seed)
+                picked = np.sort(rng.choice(len(rows), size=n, replace=False))
+                rows = [rows[i] for i in picked]
+            if columnar:
+                return self._toColumnar(keys, rows)
+            return rows
+
 class SqliteDb(ADb):
 
     # init class calling super
@@ -389,6 +702,17 @@ def _checkSpatialiteLibraryPath(dynamicLibPath):
         logger.warning(f"SPATIALITE_LIBRARY_PATH not set, trying to set it automatically to {os.environ['SPATIALITE_LIBRARY_PATH']}.")
 
 
+_GPKG_ENVELOPE_SIZES = {0: 0, 1: 32, 2: 48, 3: 48, 4: 64}
+
+def _geometryBlobToWkb(blob):
+    """Strip the geopackage binary header from a geometry blob, if present, to get plain WKB."""
+    if isinstance(blob, memoryview):
+        blob = bytes(blob)
+    if isinstance(blob, (bytes, bytearray)) and blob[:2] == b"GP" and len(blob) > 8:
+        envelope = (blob[3] >> 1) & 0x07
+        return blob[8 + _GPKG_ENVELOPE_SIZES.get(envelope, 0):]
+    return blob
+
 class GpkgDb(ADb):
     TABLE_TILES = "tiles";
     COL_TILES_ZOOM_LEVEL = "zoom_level";
@@ -426,6 +750,17 @@ class GpkgDb(ADb):
     
     def osmTile2TmsTile(self, tx:int, ty:int, zoom:int):
         return [tx, int((pow(2, zoom) - 1) - ty)];
+
+    def _getLayerExtent(self, conn, schema:str, table:str, geometryColumn:str) -> list[float]:
+        row = conn.exec_driver_sql("SELECT min_x, min_y, max_x, max_y FROM gpkg_contents WHERE table_name = ?", (table,)).first()
+        if row and None not in row:
+            return [row[0], row[1], row[2], row[3]]
+        rtree = f"rtree_{table}_{geometryColumn}"
+        if self.hasTable(rtree):
+            row = conn.exec_driver_sql(f"SELECT min(minx), min(miny), max(maxx), max(maxy) FROM {self._q(rtree)}").first()
+            if row and None not in row:
+                return [row[0], row[1], row[2], row[3]]
+        return None
     
 
 class SpatialiteDb(ADb):
@@ -440,4 +775,258 @@ class SpatialiteDb(ADb):
         res = self.query(
             "SELECT sqlite_version() as sqliteversion;")
         return [res.pgversion, res.pgisversion]
-    
+
+
+def _toSqliteValue(value):
+    """Adapt a value coming from another database to something sqlite3 can bind."""
+    if value is None or isinstance(value, (int, float, str, bytes)):
+        return value
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (memoryview, bytearray)):
+        return bytes(value)
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return str(value)
+
+def _sqlLiteral(value) -> str:
+    """Render a value as a sql literal to be used in a where clause."""
+    if value is None:
+        return "NULL"
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, (int, float, Decimal)):
+        return str(value)
+    value = str(value).replace("'", "''")
+    return f"'{value}'"
+
+
+class MirrorDb(SqliteDb):
+    """
+    An in-memory sqlite copy of a table of another database.
+
+    The table is streamed from the source database and kept locally, so that
+    hot read paths do not pay the network round trip. If refreshSeconds is set,
+    the mirror is refreshed from the source once it is older than that, the
+    next time it is read. If an updatedColumn is set, only the rows with a newer
+    value in that column are fetched and upserted on refresh, else the table is
+    reloaded completely. Note that rows deleted in the source are only noticed
+    by complete reloads.
+
+    The mirror uses a single connection, shared by all threads one at a time:
+    a connection taken with connect() (or a streamed read) blocks the other
+    threads until it is closed.
+
+    Use mirrorTable to create one.
+    """
+
+    def __init__(self, sourceDb:ADb, table_name:str, where:str=None, refreshSeconds:float=None,
+                 updatedColumn:str=None, keyColumn:str=None, indexColumns:list[str]=None,
+                 spatialIndex:bool=False, geometryColumn:str=None, chunk_size:int=10000, echo:bool=False):
+        super().__init__(DbType.SQLITE_MEM.url(), encoding=None, echo=echo)
+        # a single shared connection, else every pooled connection would see its own empty database
+        self.engine = create_engine(DbType.SQLITE_MEM.url(), echo=echo, poolclass=StaticPool,
+                                    connect_args={"check_same_thread": False})
+        # the shared connection is used by one thread at a time: a reader must not see a refresh
+        # in progress, nor roll it back when its connection is returned to the pool
+        self._lock = threading.RLock()
+        listen(self.engine, "checkout", lambda *args: self._lock.acquire())
+        listen(self.engine, "checkin", lambda *args: self._lock.release())
+        self.sourceDb = sourceDb
+        self.sourceTable = table_name
+        self.where = where
+        self.refreshSeconds = refreshSeconds
+        self.updatedColumn = updatedColumn
+        self.keyColumn = keyColumn
+        self.indexColumns = indexColumns or []
+        self.spatialIndex = spatialIndex
+        self.chunk_size = chunk_size
+
+        self.table = table_name.split(".")[-1].strip('"')
+        self.columnNames = []
+        self.geometryColumn = geometryColumn
+        self.lastRefresh = None
+        self.lastUpdatedValue = None
+
+        self._createMirrorTable()
+        if self.updatedColumn and not self.keyColumn:
+            raise Exception("Incremental refresh by updatedColumn needs a key column (primary key of the source table).")
+        self.refresh(force=True)
+
+    def getRtreeName(self) -> str:
+        """Get the name of the R-tree table holding the geometry bounds, if spatialIndex is enabled.
+
+        The R-tree id is the rowid of the mirrored table.
+        """
+        if self.spatialIndex and self.geometryColumn:
+            return f"rtree_{self.table}_{self.geometryColumn}"
+        return None
+
+    def _createMirrorTable(self):
+        with self.sourceDb.connect() as conn:
+            schema, table = self.sourceDb._split_schema_table(conn, self.sourceTable)
+            inspector = inspect(conn)
+            columns = inspector.get_columns(table, schema=schema)
+            if not self.keyColumn:
+                pk = inspector.get_pk_constraint(table, schema=schema)
+                pkColumns = pk.get("constrained_columns") if pk else None
+                if pkColumns and len(pkColumns) == 1:
+                    self.keyColumn = pkColumns[0]
+
+        colDefs = []
+        for column in columns:
+            dbColumn = DbColumn(**column)
+            self.columnNames.append(dbColumn.name)
+            if dbColumn.geoinfo or dbColumn.name == self.geometryColumn:
+                colType = "BLOB"
+                if not self.geometryColumn:
+                    self.geometryColumn = dbColumn.name
+            else:
+                try:
+                    colType = dbColumn.type.compile(dialect=self.engine.dialect)
+                except Exception:
+                    colType = ""
+            colDefs.append(f"{self._q(dbColumn.name)} {colType}".strip())
+        if self.keyColumn:
+            colDefs.append(f"PRIMARY KEY ({self._q(self.keyColumn)})")
+
+        with self.engine.connect() as conn:
+            conn.exec_driver_sql(f"CREATE TABLE {self._q(self.table)} ({', '.join(colDefs)})")
+            for column in self.indexColumns:
+                conn.exec_driver_sql(f"CREATE INDEX {self._q(f'idx_{self.table}_{column}')} ON {self._q(self.table)} ({self._q(column)})")
+            rtreeName = self.getRtreeName()
+            if rtreeName:
+                conn.exec_driver_sql(f"CREATE VIRTUAL TABLE {self._q(rtreeName)} USING rtree(id, minx, maxx, miny, maxy)")
+            conn.commit()
+
+    def isStale(self) -> bool:
+        """Check if the mirror is older than refreshSeconds."""
+        if self.lastRefresh is None:
+            return True
+        if self.refreshSeconds is None:
+            return False
+        return time.monotonic() - self.lastRefresh >= self.refreshSeconds
+
+    def refresh(self, force:bool=False) -> int:
+        """Refresh the mirror from the source database.
+
+        :param force: if True, refresh even if the mirror is not stale.
+        :return: the number of rows copied from the source.
+        """
+        if not force and not self.isStale():
+            return 0
+        with self._lock:
+            if not force and not self.isStale():
+                return 0
+            incremental = self.updatedColumn is not None and self.lastRefresh is not None
+            where = self.where
+            if incremental and self.lastUpdatedValue is not None:
+                # rows committed later with the last seen value are fetched again, the upsert is idempotent
+                updatedWhere = f"{self._q(self.updatedColumn)} >= {_sqlLiteral(self.lastUpdatedValue)}"
+                where = f"({where}) AND {updatedWhere}" if where else updatedWhere
+
+            quotedCols = [self._q(c) for c in self.columnNames]
+            insertSql = f"INSERT INTO {self._q(self.table)} ({', '.join(quotedCols)}) VALUES ({', '.join(['?'] * len(quotedCols))})"
+            if incremental:
+                updates = [f"{c}=excluded.{c}" for c in quotedCols]
+                insertSql += f" ON CONFLICT({self._q(self.keyColumn)}) DO UPDATE SET {', '.join(updates)}"
+            updatedIndex = self.columnNames.index(self.updatedColumn) if self.updatedColumn else None
+            keyIndex = self.columnNames.index(self.keyColumn) if incremental else None
+            rtreeName = self.getRtreeName()
+
+            count = 0
+            with self.engine.connect() as conn:
+                if not incremental:
+                    conn.exec_driver_sql(f"DELETE FROM {self._q(self.table)}")
+                    if rtreeName:
+                        conn.exec_driver_sql(f"DELETE FROM {self._q(rtreeName)}")
+                for rows in self.sourceDb.getTableDataStreamed(self.sourceTable, where=where, chunk_size=self.chunk_size):
+                    rows = [tuple(_toSqliteValue(v) for v in row) for row in rows]
+                    conn.exec_driver_sql(insertSql, rows)
+                    count += len(rows)
+                    if updatedIndex is not None:
+                        values = [row[updatedIndex] for row in rows if row[updatedIndex] is not None]
+                        if values:
+                            chunkMax = max(values)
+                            if self.lastUpdatedValue is None or chunkMax > self.lastUpdatedValue:
+                                self.lastUpdatedValue = chunkMax
+                    if rtreeName and incremental:
+                        self._updateSpatialIndex(conn, [row[keyIndex] for row in rows])
+                if rtreeName and not incremental:
+                    self._updateSpatialIndex(conn)
+                conn.commit()
+            self.lastRefresh = time.monotonic()
+            return count
+
+    def _updateSpatialIndex(self, conn, keys:list=None):
+        """Insert the bounds of the geometries in the R-tree, for all rows or the ones with the given keys."""
+        rtreeName = self.getRtreeName()
+        sql = f"SELECT rowid, {self._q(self.geometryColumn)} FROM {self._q(self.table)}"
+        if keys is None:
+            batches = [None]
+        else:
+            # keep below the sqlite bound variables limit
+            batches = [keys[i:i + 500] for i in range(0, len(keys), 500)]
+        for batch in batches:
+            if batch is None:
+                result = conn.exec_driver_sql(sql)
+            else:
+                result = conn.exec_driver_sql(f"{sql} WHERE {self._q(self.keyColumn)} IN ({', '.join(['?'] * len(batch))})", tuple(batch))
+            while True:
+                rows = result.fetchmany(self.chunk_size)
+                if not rows:
+                    break
+                rowids = [row[0] for row in rows]
+                geoms = shapely.from_wkb([row[1] for row in rows], on_invalid="ignore")
+                bounds = shapely.bounds(geoms)
+                values = [
+                    (rowid, b[0], b[2], b[1], b[3])
+                    for rowid, b in zip(rowids, bounds.tolist()) if b[0] == b[0] # skip empty/invalid (NaN)
+                ]
+                if values:
+                    conn.exec_driver_sql(f"INSERT OR REPLACE INTO {self._q(rtreeName)} VALUES (?, ?, ?, ?, ?)", values)
+
+    def execute(self, sql_string):
+        self.refresh()
+        return super().execute(sql_string)
+
+    def getTableData(self, table_name, order_by=None, limit=None, where=None):
+        self.refresh()
+        return super().getTableData(table_name, order_by=order_by, limit=limit, where=where)
+
+    def getTableDataStreamed(self, table_name, order_by=None, where=None, chunk_size=1000):
+        self.refresh()
+        yield from super().getTableDataStreamed(table_name, order_by=order_by, where=where, chunk_size=chunk_size)
+
+    def getRecordCount(self, table_name) -> int:
+        self.refresh()
+        return super().getRecordCount(table_name)
+
+
+def mirrorTable(sourceDb:ADb, table_name:str, where:str=None, refreshSeconds:float=None,
+                updatedColumn:str=None, keyColumn:str=None, indexColumns:list[str]=None,
+                spatialIndex:bool=False, geometryColumn:str=None, chunk_size:int=10000, echo:bool=False) -> MirrorDb:
+    """Stream a table of a (remote) database into an in-memory sqlite database for fast repeated queries.
+
+    Geometries are kept as they come from the source (for example WKB from PostGIS). If spatialIndex
+    is set, the bounds of the WKB geometries are inserted into an sqlite R-tree (see MirrorDb.getRtreeName).
+
+        mirror = mirrorTable(pgDb, "public.gauges", where="active", refreshSeconds=600,
+                            updatedColumn="lastchange", indexColumns=["code"])
+        rows = mirror.getTableData("gauges", where="code='A12'")
+
+    :param sourceDb: the database to read the table from.
+    :param table_name: the table to mirror, optionally as schema.table.
+    :param where: optional where clause to mirror only part of the table.
+    :param refreshSeconds: optional age after which the mirror is refreshed when accessed.
+    :param updatedColumn: optional column holding an increasing update timestamp/version, used to refresh incrementally.
+    :param keyColumn: the key column used to upsert on incremental refresh. Defaults to the source primary key.
+    :param indexColumns: optional list of columns to index in the mirror.
+    :param spatialIndex: if True, create an R-tree over the geometry column.
+    :param geometryColumn: the geometry column, if it can't be detected from the source (for example plain WKB blobs).
+    :param chunk_size: number of rows streamed per chunk.
+    :return: the MirrorDb to query.
+    """
+    return MirrorDb(sourceDb, table_name, where=where, refreshSeconds=refreshSeconds,
+                    updatedColumn=updatedColumn, keyColumn=keyColumn, indexColumns=indexColumns,
+                    spatialIndex=spatialIndex, geometryColumn=geometryColumn, chunk_size=chunk_size, echo=echo)
@@ -7,11 +7,18 @@ from shapely.geometry import GeometryCollection, LineString, MultiLineString, Mu
 import shapely
 from shapely.geometry.base import BaseGeometry
 import numpy as np
+import hashlib
+import json
+import os
+import pickle
+import threading
 
 class ExtendedGeometry():
     """
     A class that extends the shapely BaseGeometry class.
     """
+    __slots__ = ("geom", "attribute")
+
     def __init__(self, geom:BaseGeometry, attribute:any=None):
         self.geom = geom
         self.attribute = attribute
@@ -95,6 +102,216 @@ class ExtendedGeometry():
         """
         return HyGeomUtils.toWkt(self.geom)
     
+
+
+class ExtendedGeometryArray():
+    """
+    A columnar collection of geometries, backed by a shapely geometry array and
+    numpy attribute columns.
+
+    It offers the ExtendedGeometry methods vectorized over all geometries. Iterating
+    or indexing with an integer gives ExtendedGeometry objects, with the attributeName
+    column as attribute, so that it can be used where lists of ExtendedGeometry are expected.
+    """
+    __slots__ = ("geoms", "attributes", "attributeName")
+
+    def __init__(self, geoms, attributes:dict=None, attributeName:str=None):
+        """
+        :param geoms: the list/array of geometries.
+        :param attributes: optional dictionary of column names and value arrays, one value per geometry.
+        :param attributeName: the column to use as ExtendedGeometry attribute. Defaults to the first column.
+        """
+        if isinstance(geoms, np.ndarray) and geoms.dtype == object:
+            self.geoms = geoms
+        else:
+            self.geoms = np.empty(len(geoms), dtype=object)
+            self.geoms[:] = list(geoms)
+        self.attributes = {}
+        for name, values in (attributes or {}).items():
+            values = ExtendedGeometryArray._toColumn(values)
+            if len(values) != len(self.geoms):
+                raise Exception(f"The attribute column {name} must have the same dimension as the geometries.")
+            self.attributes[name] = values
+        if attributeName is None and self.attributes:
+            attributeName = next(iter(self.attributes))
+        self.attributeName = attributeName
+
+    @staticmethod
+    def _toColumn(values) -> np.ndarray:
+        """
+        Get a 1-D column from the values, keeping sequence values (tuples, lists) as single objects.
+        """
+        if isinstance(values, np.ndarray) and values.ndim == 1:
+            return values
+        try:
+            column = np.asarray(values)
+        except ValueError:
+            # ragged sequences
+            column = None
+        if column is None or column.ndim != 1:
+            values = list(values)
+            column = np.empty(len(values), dtype=object)
+            column[:] = values
+        return column
+
+    @staticmethod
+    def fromExtendedGeometries(extGeoms:list[ExtendedGeometry], attributeName:str="attribute") -> 'ExtendedGeometryArray':
+        """
+        Create the array from a list of ExtendedGeometry, their attribute becomes the attributeName column.
+        """
+        geoms, attributes = HyGeomUtils._toGeometryArray(extGeoms)
+        columns = {attributeName: attributes} if attributes is not None else None
+        return ExtendedGeometryArray(geoms, columns)
+
+    def _derive(self, geoms:np.ndarray) -> 'ExtendedGeometryArray':
+        return ExtendedGeometryArray(geoms, self.attributes, self.attributeName)
+
+    def __len__(self) -> int:
+        return len(self.geoms)
+
+    def __iter__(self):
+        column = self.attributes.get(self.attributeName)
+        if column is None:
+            for geom in self.geoms:
+                yield ExtendedGeometry(geom)
+        else:
+            for geom, attribute in zip(self.geoms, column.tolist()):
+                yield ExtendedGeometry(geom, attribute)
+
+    def __getitem__(self, key) -> any:
+        """
+        An integer gives an ExtendedGeometry, slices, masks and index arrays give a new ExtendedGeometryArray.
+        """
+        if isinstance(key, (int, np.integer)):
+            column = self.attributes.get(self.attributeName)
+            # tolist gives python values for numeric columns and the objects themselves for object columns
+            return ExtendedGeometry(self.geoms[key], column[key:key + 1 or None].tolist()[0] if column is not None else None)
+        return ExtendedGeometryArray(self.geoms[key], {name: values[key] for name, values in self.attributes.items()}, self.attributeName)
+
+    def filter(self, mask) -> 'ExtendedGeometryArray':
+        """
+        Get the geometries for which the boolean mask is True.
+        """
+        return self[np.asarray(mask, dtype=bool)]
+
+    def get_basegeometries(self) -> np.ndarray:
+        """
+        Get the geometry array.
+        """
+        return self.geoms
+
+    def get_attribute(self, name:str=None) -> np.ndarray:
+        """
+        Get an attribute column, by default the attributeName one.
+        """
+        return self.attributes[name or self.attributeName]
+
+    def get_srid(self) -> np.ndarray:
+        """
+        Get the SRIDs of the geometries.
+        """
+        return shapely.get_srid(self.geoms)
+
+    def set_srid(self, srid:int) -> None:
+        """
+        Set the SRID of all the geometries.
+        """
+        self.geoms = shapely.set_srid(self.geoms, srid)
+
+    def rotate(self, angle:float, origin:any="center") -> 'ExtendedGeometryArray':
+        """
+        Rotate the geometries by a given angle (degrees, counter-clockwise).
+
+        :param origin: a Point or coordinate tuple, or "center"/"centroid" to rotate each
+                    geometry around its own bounds center or centroid.
+        """
+        if isinstance(origin, str):
+            if origin == "center":
+                bounds = shapely.bounds(self.geoms)
+                origins = np.column_stack([(bounds[:, 0] + bounds[:, 2]) / 2, (bounds[:, 1] + bounds[:, 3]) / 2])
+            elif origin == "centroid":
+                origins = shapely.get_coordinates(shapely.centroid(self.geoms))
+            else:
+                raise Exception("The origin must be a Point, a coordinate tuple, 'center' or 'centroid'.")
+        else:
+            if isinstance(origin, Point):
+                origin = (origin.x, origin.y)
+            origins = np.broadcast_to(np.asarray(origin[:2], dtype=float), (len(self.geoms), 2))
+
+        radians = np.deg2rad(angle)
+        cos, sin = np.cos(radians), np.sin(radians)
+        geoms = self.geoms.copy()
+        hasZ = shapely.has_z(geoms)
+        # 2D and 3D geometries separately, to keep the z values
+        for mask in (~hasZ, hasZ):
+            if not np.any(mask):
+                continue
+            coords, indexes = shapely.get_coordinates(geoms[mask], include_z=mask is hasZ, return_index=True)
+            shifted = coords[:, :2] - origins[mask][indexes]
+            coords[:, 0] = cos * shifted[:, 0] - sin * shifted[:, 1]
+            coords[:, 1] = sin * shifted[:, 0] + cos * shifted[:, 1]
+            coords[:, :2] += origins[mask][indexes]
+            geoms[mask] = shapely.set_coordinates(geoms[mask], coords)
+        return self._derive(geoms)
+
+    def buffer(self, distance:any) -> 'ExtendedGeometryArray':
+        """
+        Buffer the geometries by a given distance (a scalar or one distance per geometry).
+        """
+        return self._derive(shapely.buffer(self.geoms, distance))
+
+    def get_area(self) -> np.ndarray:
+        """
+        Get the areas of the geometries.
+        """
+        return shapely.area(self.geoms)
+
+    def get_length(self) -> np.ndarray:
+        """
+        Get the lengths of the geometries.
+        """
+        return shapely.length(self.geoms)
+
+    def get_bounds(self) -> np.ndarray:
+        """
+        Get the bounds of the geometries as array of [xmin, ymin, xmax, ymax] rows.
+        """
+        return shapely.bounds(self.geoms)
+
+    def get_total_bounds(self) -> np.ndarray:
+        """
+        Get the bounds of all the geometries as [xmin, ymin, xmax, ymax].
+        """
+        return shapely.total_bounds(self.geoms)
+
+    def get_centroid(self) -> 'ExtendedGeometryArray':
+        """
+        Get the centroids of the geometries.
+        """
+        return self._derive(shapely.centroid(self.geoms))
+
+    def get_envelope(self) -> 'ExtendedGeometryArray':
+        """
+        Get the envelopes of the geometries.
+        """
+        return self._derive(shapely.envelope(self.geoms))
+
+    def get_intersection(self, other:any) -> 'ExtendedGeometryArray':
+        """
+        Get the intersection of the geometries with another geometry or, elementwise, 
+        with an array of geometries of the same dimension.
+        """
+        if isinstance(other, ExtendedGeometryArray):
+            other = other.geoms
+        elif isinstance(other, ExtendedGeometry):
+            other = other.geom
+        return self._derive(shapely.intersection(self.geoms, other))
+
+    def wkt(self) -> np.ndarray:
+        """
+        Get the WKT representation of the geometries.
+        """
+        return shapely.to_wkt(self.geoms)
     
 class HyGeomUtils():
 
@@ -149,57 +366,328 @@ class HyGeomUtils():
             point = ExtendedGeometry(point)
         return point
 
+    @staticmethod
+    def _offsetsToIndices(offsets) -> np.ndarray:
+        """
+        Convert offsets (start of each part plus the total length) to a part index per element.
+        """
+        offsets = np.asarray(offsets, dtype=np.int64)
+        return np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+
+    @staticmethod
+    def _coordinatesArray(coordinates) -> np.ndarray:
+        coordinates = np.asarray(coordinates, dtype=float)
+        if coordinates.ndim != 2 or coordinates.shape[1] not in (2, 3):
+            raise Exception("The input coordinates must be an array of shape (n, 2) or (n, 3).")
+        return coordinates
+
+    @staticmethod
+    def makePoints(coordinates, srid:int=None) -> np.ndarray:
+        """
+        Create an array of Points from an array of coordinates.
+
+        :param coordinates: the coordinates array of shape (n, 2) or (n, 3).
+        :param srid: the SRID to set on all geometries.
+        :return: the array of points.
+        """
+        coordinates = HyGeomUtils._coordinatesArray(coordinates)
+        points = shapely.points(coordinates)
+        if srid:
+            points = shapely.set_srid(points, srid)
+        return points
+
+    @staticmethod
+    def makeLineStrings(coordinates, offsets=None, indices=None, srid:int=None) -> np.ndarray:
+        """
+        Create an array of LineStrings from a flat array of coordinates.
+
+        The coordinates are assigned to the lines either through offsets (the start of
+        each line in the coordinates plus the total count, as in [0, 3, 5]) or through
+        indices (the line index of each coordinate, as in [0, 0, 0, 1, 1]).
+
+        :param coordinates: the coordinates array of shape (n, 2) or (n, 3).
+        :param offsets: the offsets of the lines in the coordinates.
+        :param indices: the line index of each coordinate (sorted).
+        :param srid: the SRID to set on all geometries.
+        :return: the array of lines.
+        """
+        coordinates = HyGeomUtils._coordinatesArray(coordinates)
+        if offsets is not None:
+            indices = HyGeomUtils._offsetsToIndices(offsets)
+        if indices is None:
+            raise Exception("Either offsets or indices have to be given.")
+        lines = shapely.linestrings(coordinates, indices=indices)
+        if srid:
+            lines = shapely.set_srid(lines, srid)
+        return lines
+
+    @staticmethod
+    def makePolygons(coordinates, offsets=None, indices=None, polygonIndices=None, srid:int=None) -> np.ndarray:
+        """
+        Create an array of Polygons from a flat array of ring coordinates.
+
+        The coordinates are assigned to rings through offsets or indices (see makeLineStrings),
+        rings are closed if necessary. By default every ring is a polygon shell, to create
+        polygons with holes pass polygonIndices, the polygon index of each ring, in which
+        case the first ring of each polygon is the shell and the following ones are holes.
+
+        :param coordinates: the coordinates array of shape (n, 2) or (n, 3).
+        :param offsets: the offsets of the rings in the coordinates.
+        :param indices: the ring index of each coordinate (sorted).
+        :param polygonIndices: optional polygon index of each ring (sorted).
+        :param srid: the SRID to set on all geometries.
+        :return: the array of polygons.
+        """
+        coordinates = HyGeomUtils._coordinatesArray(coordinates)
+        if offsets is not None:
+            indices = HyGeomUtils._offsetsToIndices(offsets)
+        if indices is None:
+            raise Exception("Either offsets or indices have to be given.")
+        rings = shapely.linearrings(coordinates, indices=indices)
+        if polygonIndices is not None:
+            polygons = shapely.polygons(rings, indices=polygonIndices)
+        else:
+            polygons = shapely.polygons(rings)
+        if srid:
+            polygons = shapely.set_srid(polygons, srid)
+        return polygons
+
     # static method to convert geometry to 2D
     @staticmethod
     def convert2D( geom:BaseGeometry ) -> BaseGeometry:
         if geom.has_z:
-            geom = transform(lambda x,y,z=None: (x,y), geom)
+            geom = shapely.force_2d(geom)
         return geom
+
+    @staticmethod
+    def _toGeometryArray(geoms) -> tuple[np.ndarray, list]:
+        """
+        Get a geometry array from a list/array of geometries, ExtendedGeometries or an ExtendedGeometryArray.
+
+        :return: the geometry array and the list of attributes, if the input was made of ExtendedGeometries 
+                (or the ExtendedGeometryArray itself).
+        """
+        if isinstance(geoms, ExtendedGeometryArray):
+            return geoms.geoms, geoms
+        if len(geoms) > 0 and isinstance(geoms[0], ExtendedGeometry):
+            array = np.empty(len(geoms), dtype=object)
+            array[:] = [g.geom for g in geoms]
+            return array, [g.attribute for g in geoms]
+        return np.asarray(geoms, dtype=object), None
+
+    @staticmethod
+    def _fromGeometryArray(array:np.ndarray, attributes:list) -> any:
+        """
+        The inverse of _toGeometryArray, returning ExtendedGeometries if there were attributes.
+        """
+        if attributes is None:
+            return array
+        if isinstance(attributes, ExtendedGeometryArray):
+            return attributes._derive(array)
+        return [ExtendedGeometry(g, a) for g, a in zip(array, attributes)]
+
+    @staticmethod
+    def force2D(geoms) -> any:
+        """
+        Drop the z and m values of all the geometries of an array.
+
+        :param geoms: the array/list of geometries, list of ExtendedGeometries or ExtendedGeometryArray.
+        :return: the 2D geometries, in the same form as the input.
+        """
+        array, attributes = HyGeomUtils._toGeometryArray(geoms)
+        return HyGeomUtils._fromGeometryArray(shapely.force_2d(array), attributes)
+
+    @staticmethod
+    def force3D(geoms, z:any=0.0) -> any:
+        """
+        Make all the geometries of an array 3D.
+
+        The z value can be:
+
+            - a constant, used for the vertices that do not have a z value yet.
+            - an array with one z value per vertex, in the order of shapely.get_coordinates, 
+              which replaces existing z values.
+            - a function taking the (n, 2) array of all xy coordinates and returning the 
+              n z values, for example to sample a DEM.
+
+        Any m values are dropped.
+
+        :param geoms: the array/list of geometries, list of ExtendedGeometries or ExtendedGeometryArray.
+        :param z: the constant, per vertex array or function giving the z values.
+        :return: the 3D geometries, in the same form as the input.
+        """
+        array, attributes = HyGeomUtils._toGeometryArray(geoms)
+        array = HyGeomUtils.dropM(array)
+        if np.isscalar(z):
+            return HyGeomUtils._fromGeometryArray(shapely.force_3d(array, z), attributes)
+
+        result = shapely.force_3d(shapely.force_2d(array), 0.0)
+        coords = shapely.get_coordinates(result, include_z=True)
+        if callable(z):
+            z = z(coords[:, :2])
+        z = np.asarray(z, dtype=float)
+        if z.shape != (len(coords),):
+            raise Exception(f"The z values must be one per vertex ({len(coords)}).")
+        coords[:, 2] = z
+        result = shapely.set_coordinates(result, coords)
+        return HyGeomUtils._fromGeometryArray(result, attributes)
+
+    @staticmethod
+    def dropM(geoms) -> any:
+        """
+        Drop the m values of all the geometries of an array, keeping z values.
+
+        :param geoms: the array/list of geometries, list of ExtendedGeometries or ExtendedGeometryArray.
+        :return: the geometries without m, in the same form as the input.
+        """
+        array, attributes = HyGeomUtils._toGeometryArray(geoms)
+        hasM = getattr(shapely, "has_m", None)
+        if hasM is None:
+            # shapely versions without m support
+            return HyGeomUtils._fromGeometryArray(array, attributes)
+        measured = hasM(array)
+        if np.any(measured):
+            array = array.copy()
+            withZ = measured & shapely.has_z(array)
+            array[measured & ~withZ] = shapely.force_2d(array[measured & ~withZ])
+            if np.any(withZ):
+                coords = shapely.get_coordinates(array[withZ], include_z=True)
+                array[withZ] = shapely.set_coordinates(shapely.force_3d(shapely.force_2d(array[withZ]), 0.0), coords)
+        return HyGeomUtils._fromGeometryArray(array, attributes)
     
 
     @staticmethod
     def splitLineEquidistant(line:LineString, segmentLength:float = 3.0) -> list[LineString]:
         if not isinstance(line, LineString):
             raise Exception("The input geometry must be a LineString.")
-        lineCoords = list(line.coords)
-        
-        lastSegment = [] # Coordinates
-        segments = [] # LineString segments
-        accumulatedLength = 0.0
-
-        i = 0
-        while i < len(lineCoords)-1:
-            c1 = lineCoords[i]
-            c2 = lineCoords[i+1]
-
-            lastSegment.append(c1)
-
-            length = Point(c1).distance(Point(c2))
-            if length + accumulatedLength >= segmentLength:
-                offsetLength = segmentLength - accumulatedLength
-                ratio = offsetLength / length
-                dx = c2[0] - c1[0]
-                dy = c2[1] - c1[1]
-
-                segmentationPoint = (c1[0] + (dx * ratio), c1[1] + (dy * ratio))
-                lastSegment.append(segmentationPoint)
-                segments.append(LineString(lastSegment))
-
-                lastSegment = []
-                accumulatedLength = 0.0
-                if not segmentationPoint in lineCoords:
-                    lineCoords.insert(i+1, segmentationPoint)
-            else:
-                accumulatedLength += length
+        segments, _ = HyGeomUtils.splitLinesEquidistant([line], segmentLength)
+        return list(segments)
 
-            i += 1
+    @staticmethod
+    def _lineMeasures(lines:np.ndarray) -> tuple:
+        """
+        Get the flat coordinates of an array of LineStrings together with the measures
+        needed to work on them by distance.
 
-        lastSegment.append(lineCoords[-1])
-        segments.append(LineString(lastSegment))
-        return segments
-            
+        :return: a tuple with the coordinates, the line index of each coordinate, the cumulative
+                distance of each coordinate over all lines (segments between lines have no length),
+                the index of the first coordinate of each line and the length of each line.
+        """
+        if np.any(shapely.get_type_id(lines) != 1):
+            raise Exception("The input geometries must be LineStrings.")
+        includeZ = bool(np.any(shapely.has_z(lines)))
+        coords, lineIndexes = shapely.get_coordinates(lines, include_z=includeZ, return_index=True)
+        counts = np.bincount(lineIndexes, minlength=len(lines))
+        if np.any(counts < 2):
+            raise Exception("The input LineStrings must not be empty.")
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+
+        deltas = coords[1:, :2] - coords[:-1, :2]
+        segmentLengths = np.hypot(deltas[:, 0], deltas[:, 1])
+        segmentLengths[lineIndexes[1:] != lineIndexes[:-1]] = 0.0
+        distances = np.concatenate([[0.0], np.cumsum(segmentLengths)])
+        lengths = distances[starts + counts - 1] - distances[starts]
+        return coords, lineIndexes, distances, starts, lengths
+
+    @staticmethod
+    def splitLinesEquidistant(lines, segmentLength:float = 3.0) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Split LineStrings into segments of the given length (the last segment of each line
+        gets the remainder).
+
+        All lines are processed at once on the flat coordinates: the cut points are merged
+        with the vertices by line and distance and the segments are assembled by position,
+        with no python loop over lines or cuts.
+
+        :param lines: a LineString or an array/list of LineStrings.
+        :param segmentLength: the length of the segments.
+        :return: a tuple with the array of segments and the index of the source line of each segment.
+        """
+        if segmentLength <= 0:
+            raise Exception("The segment length must be positive.")
+        if isinstance(lines, BaseGeometry):
+            lines = [lines]
+        lines = np.asarray(lines, dtype=object)
+        coords, lineIndexes, distances, starts, lengths = HyGeomUtils._lineMeasures(lines)
+        linesCount = len(lines)
+
+        # work on the distances from the start of each line, so that the cuts are not
+        # affected by the rounding of the distances accumulated over the previous lines
+        counts = np.diff(np.append(starts, len(coords)))
+        localDistances = distances - distances[starts][lineIndexes]
+        lengths = localDistances[starts + counts - 1]
+        # no cut too near to the line end, it would give an empty segment
+        tolerance = lengths * 1e-9
+        cutsCount = np.maximum(0, np.ceil((lengths - tolerance) / segmentLength).astype(np.int64) - 1)
+        pieces = cutsCount + 1
+        cutLines = np.repeat(np.arange(linesCount), cutsCount)
+        firstCut = np.concatenate([[0], np.cumsum(cutsCount)[:-1]])
+        cutNumbers = np.arange(len(cutLines)) - firstCut[cutLines] + 1
+        cutDistances = cutNumbers * segmentLength
+
+        # merge vertices and cuts by line and distance, once with the vertices before the cuts
+        # at the same distance and once after, to count the cuts before each vertex and the
+        # vertices before each cut
+        allLines = np.concatenate([lineIndexes, cutLines])
+        allDistances = np.concatenate([localDistances, cutDistances])
+        isCut = np.concatenate([np.zeros(len(coords), dtype=bool), np.ones(len(cutLines), dtype=bool)])
+        order = np.lexsort((isCut, allDistances, allLines))
+        sortedIsCut = isCut[order]
+        cutsBefore = np.cumsum(sortedIsCut)[~sortedIsCut]
+        verticesUpTo = np.cumsum(~sortedIsCut)[sortedIsCut]
+        orderAfter = np.lexsort((~isCut, allDistances, allLines))
+        cutsUpTo = np.cumsum(isCut[orderAfter])[~isCut[orderAfter]]
+
+        # interpolate the cut points on the segments containing them
+        cutSegments = np.empty(len(cutLines), dtype=np.int64)
+        cutSegments[order[sortedIsCut] - len(coords)] = verticesUpTo - 1
+        lineStarts = starts[cutLines]
+        cutSegments = np.clip(cutSegments, lineStarts, lineStarts + counts[cutLines] - 2)
+        segmentStart = localDistances[cutSegments]
+        segmentSizes = localDistances[cutSegments + 1] - segmentStart
+        ratio = np.zeros(len(cutLines))
+        nonEmpty = segmentSizes > 0
+        ratio[nonEmpty] = (cutDistances[nonEmpty] - segmentStart[nonEmpty]) / segmentSizes[nonEmpty]
+        ratio = np.clip(ratio, 0.0, 1.0)
+        cutCoords = coords[cutSegments] + ratio[:, None] * (coords[cutSegments + 1] - coords[cutSegments])
+
+        # assign the vertices to the pieces, dropping the ones that fall exactly on a cut
+        vertexCutsBefore = np.empty(len(coords), dtype=np.int64)
+        vertexCutsBefore[order[~sortedIsCut]] = cutsBefore
+        vertexCutsUpTo = np.empty(len(coords), dtype=np.int64)
+        vertexCutsUpTo[orderAfter[~isCut[orderAfter]]] = cutsUpTo
+        keep = vertexCutsBefore == vertexCutsUpTo
+        vertexPieces = (lineIndexes + vertexCutsBefore)[keep]
+
+        piecesCount = linesCount + len(cutLines)
+        cutEndPieces = cutLines + np.arange(len(cutLines))
+        cutStartPieces = cutEndPieces + 1
+        verticesPerPiece = np.bincount(vertexPieces, minlength=piecesCount)
+        hasStart = np.zeros(piecesCount, dtype=np.int64)
+        hasStart[cutStartPieces] = 1
+        hasEnd = np.zeros(piecesCount, dtype=np.int64)
+        hasEnd[cutEndPieces] = 1
+        pieceSizes = hasStart + verticesPerPiece + hasEnd
+        pieceOffsets = np.concatenate([[0], np.cumsum(pieceSizes)[:-1]])
+
+        firstVertex = np.concatenate([[0], np.cumsum(verticesPerPiece)[:-1]])
+        vertexRanks = np.arange(len(vertexPieces)) - firstVertex[vertexPieces]
+        segmentCoords = np.empty((int(pieceSizes.sum()), coords.shape[1]))
+        segmentCoords[pieceOffsets[vertexPieces] + hasStart[vertexPieces] + vertexRanks] = coords[keep]
+        segmentCoords[pieceOffsets[cutStartPieces]] = cutCoords
+        segmentCoords[pieceOffsets[cutEndPieces] + pieceSizes[cutEndPieces] - 1] = cutCoords
+
+        segments = shapely.linestrings(segmentCoords, indices=np.repeat(np.arange(piecesCount), pieceSizes))
+        sourceIndexes = np.repeat(np.arange(linesCount), pieces)
+        if coords.shape[1] == 3:
+            # mixed 2D and 3D input, the 2D lines got NaN z values
+            flat = ~shapely.has_z(lines)[sourceIndexes]
+            segments[flat] = shapely.force_2d(segments[flat])
+        srids = shapely.get_srid(lines)
+        if np.any(srids != 0):
+            segments = shapely.set_srid(segments, srids[sourceIndexes])
+        return segments, sourceIndexes
 
-        
     @staticmethod
     def splitLineEquidistantShply(line:LineString, distanceDelta:float = 3.0) -> list[LineString]:
         if not isinstance(line, LineString):
@@ -334,6 +822,64 @@ class HyGeomUtils():
         return [a, b, d, e, xoff, yoff]
     
 
+class _LazyWkbGeometries():
+    """
+    A read only geometry list backed by a (memory mapped) WKB buffer and offsets,
+    decoding geometries only when they are accessed.
+    """
+    def __init__(self, wkbBuffer:np.ndarray, offsets:np.ndarray, extended:bool = False, attributes:np.ndarray = None):
+        """
+        :param wkbBuffer: the uint8 array of the concatenated WKB.
+        :param offsets: the start of each geometry in the buffer, plus the end of the last one.
+        :param extended: if True, items are returned as ExtendedGeometry.
+        :param attributes: the optional ExtendedGeometry attributes.
+        """
+        self.wkbBuffer = wkbBuffer
+        self.offsets = offsets
+        self.extended = extended
+        self.attributes = attributes
+        self._decoded = np.empty(len(offsets) - 1, dtype=object)
+        self._isDecoded = np.zeros(len(offsets) - 1, dtype=bool)
+
+    def __len__(self) -> int:
+        return len(self._decoded)
+
+    def __getitem__(self, index:int) -> any:
+        return self.getItems(np.array([index]))[0]
+
+    def __iter__(self):
+        for start in range(0, len(self), 100000):
+            yield from self.getItems(np.arange(start, min(start + 100000, len(self))))
+
+    def getItems(self, indexes:np.ndarray) -> np.ndarray:
+        """
+        Get the items at the given indexes, geometries or ExtendedGeometry.
+        """
+        geoms = self.getGeometries(indexes)
+        if not self.extended:
+            return geoms
+        items = np.empty(len(geoms), dtype=object)
+        if self.attributes is None:
+            items[:] = [ExtendedGeometry(geom) for geom in geoms]
+        else:
+            items[:] = [ExtendedGeometry(geom, attribute) for geom, attribute in zip(geoms, self.attributes[indexes].tolist())]
+        return items
+
+    def getGeometries(self, indexes:np.ndarray) -> np.ndarray:
+        """
+        Get the geometries at the given indexes, decoding the ones not accessed yet.
+        """
+        indexes = np.asarray(indexes, dtype=np.int64)
+        missing = np.unique(indexes[~self._isDecoded[indexes]])
+        if len(missing) > 0:
+            starts = self.offsets[missing]
+            ends = self.offsets[missing + 1]
+            wkbs = [self.wkbBuffer[s:e].tobytes() for s, e in zip(starts.tolist(), ends.tolist())]
+            self._decoded[missing] = shapely.from_wkb(wkbs)
+            self._isDecoded[missing] = True
+        return self._decoded[indexes]
+
+
 class HySTRTreeIndex():
     """
     Wrapper for shapely STRtree index.
@@ -349,10 +895,17 @@ class HySTRTreeIndex():
                         geometries. Naturally it has to have the same dimension as the geomList.
         """
         self.geomList = geomList
-        self.index = shapely.STRtree(geomList)
+        if isinstance(geomList, ExtendedGeometryArray):
+            # queries return the ExtendedGeometry items
+            self.index = shapely.STRtree(geomList.geoms)
+        else:
+            self.index = shapely.STRtree(geomList)
         self.referenceList = referenceList
         if referenceList is not None and len(referenceList) != len(geomList):
             raise Exception("The reference list must have the same dimension as the geometry list.")
+        self._items = None
+        # set when loaded from a snapshot: the tree holds the envelopes and geometries are decoded lazily
+        self._lazy = False
 
     def query(self, geom:BaseGeometry) -> list[BaseGeometry]:
         """
@@ -363,7 +916,7 @@ class HySTRTreeIndex():
         :return: a list of intersecting geometries
         """
         indexes = self.index.query(geom)
-        if self.referenceList:
+        if self.referenceList is not None:
             return [self.referenceList[i] for i in indexes]
         return [self.geomList[i] for i in indexes]
     
@@ -376,6 +929,9 @@ class HySTRTreeIndex():
 
         :return: the nearest geometry or none.
         """
+        if self._lazy:
+            _, items = self.queryNearestBulk([geom], maxDistance=maxDistance)
+            return items[0] if len(items) > 0 else None
         nearestGeomIndex = self.index.query_nearest(geom, max_distance=maxDistance)
         if nearestGeomIndex is not None:
             index = None
@@ -386,8 +942,515 @@ class HySTRTreeIndex():
             else:
                 index = nearestGeomIndex
         
-            if self.referenceList:
+            if self.referenceList is not None:
                 return self.referenceList[index]
             return self.geomList[index]
         return None
-    
+
+    def getItems(self, indexes:np.ndarray) -> np.ndarray:
+        """
+        Map tree indexes to the references (or the geometries if no reference list is set).
+
+        :param indexes: the array of tree indexes.
+        :return: the object array of references or geometries.
+        """
+        if self._lazy and self.referenceList is None:
+            return self.geomList.getItems(indexes)
+        if self._items is None:
+            items = self.referenceList if self.referenceList is not None else self.geomList
+            if isinstance(items, ExtendedGeometryArray):
+                items = list(items)
+            self._items = np.fromiter(items, dtype=object, count=len(items))
+        return self._items[indexes]
+
+    def queryBulk(self, geoms:any, predicate:str = "intersects", distance:float = None, returnIndexes:bool = False) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Query the spatial index for many geometries at once, testing the exact predicate.
+
+        :param geoms: the array/list of geometries (or ExtendedGeometryArray) to query for.
+        :param predicate: the predicate the input geometries have to satisfy with the tree 
+                    geometries: intersects, contains, within, dwithin or any other shapely STRtree 
+                    predicate. None to only test bounding boxes.
+        :param distance: the distance for the dwithin predicate.
+        :param returnIndexes: if True, return the tree indexes instead of the references/geometries.
+
+        :return: a tuple with the array of input indexes and the array of the matching 
+                references (or geometries/tree indexes), one entry per matching pair.
+        """
+        if isinstance(geoms, ExtendedGeometryArray):
+            geoms = geoms.geoms
+        if predicate == "dwithin" and distance is None:
+            raise Exception("The dwithin predicate needs a distance.")
+        geoms = np.asarray(geoms, dtype=object)
+        if self._lazy and predicate is not None:
+            # the tree holds envelopes: get the candidates and test the predicate on the decoded geometries
+            boxPredicate = "dwithin" if predicate == "dwithin" else None
+            inputIndexes, treeIndexes = self.index.query(geoms, predicate=boxPredicate, distance=distance)
+            args = (distance,) if predicate == "dwithin" else ()
+            matches = getattr(shapely, predicate)(geoms[inputIndexes], self.geomList.getGeometries(treeIndexes), *args)
+            inputIndexes, treeIndexes = inputIndexes[matches], treeIndexes[matches]
+        else:
+            inputIndexes, treeIndexes = self.index.query(geoms, predicate=predicate, distance=distance)
+        if returnIndexes:
+            return inputIndexes, treeIndexes
+        return inputIndexes, self.getItems(treeIndexes)
+
+    def queryNearestBulk(self, geoms:any, k:int = 1, maxDistance:float = None, returnDistance:bool = False, returnIndexes:bool = False) -> tuple:
+        """
+        Query the spatial index for the k nearest geometries of many geometries at once.
+
+        Inputs with no tree geometry within maxDistance are missing from the result.
+
+        :param geoms: the array/list of geometries (or ExtendedGeometryArray) to query for.
+        :param k: the number of nearest geometries to get for each input.
+        :param maxDistance: the maximum distance to search for.
+        :param returnDistance: if True, also return the distances.
+        :param returnIndexes: if True, return the tree indexes instead of the references/geometries.
+
+        :return: a tuple with the array of input indexes and the array of the matching references
+                (or geometries/tree indexes) sorted by distance for each input, plus the 
+                distances if requested.
+        """
+        if isinstance(geoms, ExtendedGeometryArray):
+            geoms = geoms.geoms
+        geoms = np.asarray(geoms, dtype=object)
+        if k < 1:
+            raise Exception("k must be at least 1.")
+        (inputIndexes, treeIndexes), distances = self.index.query_nearest(geoms, max_distance=maxDistance, return_distance=True, all_matches=False)
+        if k > 1 and len(inputIndexes) > 0:
+            inputIndexes, treeIndexes, distances = self._kNearest(geoms, k, maxDistance, inputIndexes, distances)
+        if self._lazy and len(inputIndexes) > 0:
+            inputIndexes, treeIndexes, distances = self._refineNearest(geoms, k, maxDistance, inputIndexes, treeIndexes)
+        result = (inputIndexes, treeIndexes if returnIndexes else self.getItems(treeIndexes))
+        if returnDistance:
+            result += (distances,)
+        return result
+
+    def _kNearest(self, geoms:np.ndarray, k:int, maxDistance:float, inputIndexes:np.ndarray, nearestDistances:np.ndarray) -> tuple:
+        """
+        Get the k nearest by querying growing search radiuses around each input, 
+        starting from the distance of the nearest geometry.
+        """
+        treeGeoms = self.index.geometries
+        treeBounds = shapely.total_bounds(treeGeoms)
+        inputBounds = shapely.total_bounds(geoms[inputIndexes])
+        allBounds = [min(treeBounds[0], inputBounds[0]), min(treeBounds[1], inputBounds[1]), 
+                     max(treeBounds[2], inputBounds[2]), max(treeBounds[3], inputBounds[3])]
+        # no distance can be larger than the diagonal of everything
+        diagonal = np.hypot(allBounds[2] - allBounds[0], allBounds[3] - allBounds[1])
+        step = max(diagonal / np.sqrt(len(treeGeoms)), 1e-9)
+        radiuses = np.maximum(2 * nearestDistances, step)
+        if maxDistance is not None:
+            radiuses = np.minimum(radiuses, maxDistance)
+
+        pending = inputIndexes
+        candidateInputs = []
+        candidateTrees = []
+        while len(pending) > 0:
+            found, tree = self.index.query(geoms[pending], predicate="dwithin", distance=radiuses)
+            counts = np.bincount(found, minlength=len(pending))
+            done = (counts >= k) | (radiuses >= diagonal)
+            if maxDistance is not None:
+                done |= radiuses >= maxDistance
+            keep = done[found]
+            candidateInputs.append(pending[found[keep]])
+            candidateTrees.append(tree[keep])
+            pending = pending[~done]
+            radiuses = radiuses[~done] * 2
+            if maxDistance is not None:
+                radiuses = np.minimum(radiuses, maxDistance)
+
+        candidateInputs = np.concatenate(candidateInputs)
+        candidateTrees = np.concatenate(candidateTrees)
+        distances = shapely.distance(geoms[candidateInputs], treeGeoms[candidateTrees])
+        return HySTRTreeIndex._nearestRanked(candidateInputs, candidateTrees, distances, k)
+
+    @staticmethod
+    def _nearestRanked(inputIndexes:np.ndarray, treeIndexes:np.ndarray, distances:np.ndarray, k:int) -> tuple:
+        """
+        Keep the k nearest candidates per input, sorted by input and distance.
+        """
+        order = np.lexsort((treeIndexes, distances, inputIndexes))
+        inputIndexes, treeIndexes, distances = inputIndexes[order], treeIndexes[order], distances[order]
+        groupStarts = np.concatenate([[0], np.flatnonzero(np.diff(inputIndexes)) + 1])
+        groupSizes = np.diff(np.concatenate([groupStarts, [len(inputIndexes)]]))
+        ranks = np.arange(len(inputIndexes)) - np.repeat(groupStarts, groupSizes)
+        keep = ranks < k
+        return inputIndexes[keep], treeIndexes[keep], distances[keep]
+
+    def _refineNearest(self, geoms:np.ndarray, k:int, maxDistance:float, inputIndexes:np.ndarray, treeIndexes:np.ndarray) -> tuple:
+        """
+        Turn the k nearest envelopes of a snapshot index into the exact k nearest geometries.
+
+        The exact distance of the k-th nearest envelope geometry bounds the search: every
+        geometry that is nearer has an envelope within that distance.
+        """
+        distances = shapely.distance(geoms[inputIndexes], self.geomList.getGeometries(treeIndexes))
+        inputs = np.unique(inputIndexes)
+        position = np.searchsorted(inputs, inputIndexes)
+        bounds = np.zeros(len(inputs))
+        np.maximum.at(bounds, position, distances)
+        if maxDistance is not None:
+            counts = np.bincount(position, minlength=len(inputs))
+            bounds[counts < k] = maxDistance
+            bounds = np.minimum(bounds, maxDistance)
+
+        found, candidates = self.index.query(geoms[inputs], predicate="dwithin", distance=bounds)
+        candidateInputs = inputs[found]
+        distances = shapely.distance(geoms[candidateInputs], self.geomList.getGeometries(candidates))
+        keep = distances <= bounds[found]
+        return HySTRTreeIndex._nearestRanked(candidateInputs[keep], candidates[keep], distances[keep], k)
+
+    @staticmethod
+    def _wkbChunks(geoms:any, chunkSize:int = 100000):
+        """
+        Yield the WKB (with SRID) of the geometries as joined chunks plus the lengths of each geometry.
+        """
+        if isinstance(geoms, ExtendedGeometryArray):
+            geoms = geoms.geoms
+        for start in range(0, len(geoms), chunkSize):
+            chunk = np.asarray(geoms[start:start + chunkSize], dtype=object)
+            wkbs = shapely.to_wkb(chunk, include_srid=True)
+            yield b"".join(wkbs), np.fromiter(map(len, wkbs), dtype=np.int64, count=len(wkbs))
+
+    @staticmethod
+    def _referencesPayload(geomList:any, referenceList:list) -> bytes:
+        payload = {"references": referenceList}
+        if isinstance(geomList, ExtendedGeometryArray):
+            payload["attributes"] = geomList.attributes
+            payload["attributeName"] = geomList.attributeName
+        return pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def computeContentHash(geomList:any, referenceList:list = None) -> str:
+        """
+        Compute the content hash of geometries and references, as stored in snapshots by save.
+
+        Compare it with readSnapshotHash to know if a snapshot is stale.
+        """
+        hasher = hashlib.sha256()
+        lengths = [np.zeros(1, dtype=np.int64)]
+        for wkb, chunkLengths in HySTRTreeIndex._wkbChunks(geomList):
+            hasher.update(wkb)
+            lengths.append(chunkLengths)
+        hasher.update(np.cumsum(np.concatenate(lengths)).tobytes())
+        hasher.update(HySTRTreeIndex._referencesPayload(geomList, referenceList))
+        return hasher.hexdigest()
+
+    def save(self, path:str) -> str:
+        """
+        Save a snapshot of the index to a folder, so that it can be loaded quickly with load.
+
+        The folder contains the geometries as concatenated WKB (memory mappable), their
+        offsets and envelopes as numpy files, the pickled references and a metadata file
+        with the content hash.
+
+        :param path: the folder to write to.
+        :return: the content hash of the snapshot.
+        """
+        if self._lazy:
+            raise Exception("A snapshot index can't be saved again, it is already on disk.")
+        os.makedirs(path, exist_ok=True)
+        hasher = hashlib.sha256()
+        lengths = [np.zeros(1, dtype=np.int64)]
+        with open(os.path.join(path, "geometries.wkb"), "wb") as f:
+            for wkb, chunkLengths in HySTRTreeIndex._wkbChunks(self.geomList):
+                hasher.update(wkb)
+                f.write(wkb)
+                lengths.append(chunkLengths)
+        offsets = np.cumsum(np.concatenate(lengths))
+        hasher.update(offsets.tobytes())
+        np.save(os.path.join(path, "offsets.npy"), offsets)
+        np.save(os.path.join(path, "bounds.npy"), shapely.bounds(self.index.geometries))
+        payload = HySTRTreeIndex._referencesPayload(self.geomList, self.referenceList)
+        hasher.update(payload)
+        with open(os.path.join(path, "references.pkl"), "wb") as f:
+            f.write(payload)
+
+        contentHash = hasher.hexdigest()
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump({"version": 1, "count": len(offsets) - 1, "hash": contentHash}, f)
+        return contentHash
+
+    @staticmethod
+    def readSnapshotHash(path:str) -> str:
+        """
+        Read the content hash of a snapshot folder without loading it.
+        """
+        with open(os.path.join(path, "meta.json")) as f:
+            return json.load(f)["hash"]
+
+    @staticmethod
+    def load(path:str, expectedHash:str = None, verify:bool = False) -> 'HySTRTreeIndex':
+        """
+        Load an index snapshot saved with save.
+
+        The tree is built on the stored envelopes and the geometries stay in the memory
+        mapped WKB file until a query needs them, so loading is fast also for huge indexes.
+        Query results are the same as for the original index.
+
+        The references are unpickled, so only load snapshots from trusted sources.
+
+        :param path: the snapshot folder.
+        :param expectedHash: if set, the snapshot hash has to match it, else the snapshot is stale.
+        :param verify: if True, recompute the hash from the files to detect corrupted snapshots.
+        :return: the loaded index.
+        """
+        contentHash = HySTRTreeIndex.readSnapshotHash(path)
+        if expectedHash is not None and contentHash != expectedHash:
+            raise Exception(f"The index snapshot in {path} is stale (hash {contentHash}, expected {expectedHash}).")
+
+        offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        bounds = np.load(os.path.join(path, "bounds.npy"), mmap_mode="r")
+        wkbPath = os.path.join(path, "geometries.wkb")
+        if offsets[-1] > 0:
+            wkbBuffer = np.memmap(wkbPath, dtype=np.uint8, mode="r")
+        else:
+            wkbBuffer = np.zeros(0, dtype=np.uint8)
+        with open(os.path.join(path, "references.pkl"), "rb") as f:
+            payloadBytes = f.read()
+
+        if verify:
+            hasher = hashlib.sha256()
+            for start in range(0, len(wkbBuffer), 64 * 1024 * 1024):
+                hasher.update(wkbBuffer[start:start + 64 * 1024 * 1024])
+            hasher.update(np.asarray(offsets).tobytes())
+            hasher.update(payloadBytes)
+            if hasher.hexdigest() != contentHash:
+                raise Exception(f"The index snapshot in {path} is corrupted, its content doesn't match its hash.")
+
+        payload = pickle.loads(payloadBytes)
+        index = HySTRTreeIndex.__new__(HySTRTreeIndex)
+        envelopes = shapely.box(bounds[:, 0], bounds[:, 1], bounds[:, 2], bounds[:, 3])
+        envelopes[np.isnan(bounds[:, 0])] = None
+        index.index = shapely.STRtree(envelopes)
+        extended = "attributes" in payload
+        attributes = payload["attributes"].get(payload["attributeName"]) if extended else None
+        index.geomList = _LazyWkbGeometries(wkbBuffer, offsets, extended, attributes)
+        index.referenceList = payload["references"]
+        index._items = None
+        index._lazy = True
+        return index
+
+
+
+class HyDynamicSTRTreeIndex():
+    """
+    A spatial index that supports inserts and removals.
+
+    It combines a static STRtree with a small buffer of inserted geometries and
+    tombstones for the removed ones. When the buffer and tombstones pass a threshold,
+    the static tree is rebuilt in a background thread, while queries keep working on
+    the current state. Edits done during the rebuild are replayed on the new tree.
+
+    References identify the items, so they have to be hashable and unique. If no
+    reference is given, the geometry itself is used.
+    """
+
+    def __init__(self, geomList:list[BaseGeometry] = None, referenceList:list = None, rebuildThreshold:int = 1000, background:bool = True):
+        """
+        Initialize the index.
+
+        :param geomList: the optional initial list of geometries to index.
+        :param referenceList: the list of reference objects of the geometries. If not set,
+                        the geometries are their own references.
+        :param rebuildThreshold: the number of buffered inserts and removals that triggers a rebuild.
+        :param background: if True, rebuilds happen in a background thread.
+        """
+        geomList = [] if geomList is None else geomList
+        if isinstance(geomList, ExtendedGeometryArray):
+            geomList = list(geomList)
+        if referenceList is not None and len(referenceList) != len(geomList):
+            raise Exception("The reference list must have the same dimension as the geometry list.")
+        self.rebuildThreshold = rebuildThreshold
+        self.background = background
+        self._lock = threading.RLock()
+        self._rebuildThread = None
+        # edits done while a rebuild is running, replayed on the rebuilt tree
+        self._pendingEdits = None
+        self._setBase(list(geomList), list(referenceList) if referenceList is not None else list(geomList))
+
+    def _setBase(self, geoms:list, refs:list):
+        geoms = np.fromiter(geoms, dtype=object, count=len(geoms))
+        positions = {}
+        for i, ref in enumerate(refs):
+            if ref in positions:
+                raise Exception(f"The reference {ref} is not unique.")
+            positions[ref] = i
+        self._baseIndex = HySTRTreeIndex(geoms)
+        self._baseGeoms = geoms
+        self._baseRefs = refs
+        self._basePositions = positions
+        self._baseAlive = np.ones(len(refs), dtype=bool)
+        self._tombstones = 0
+        self._delta = {}
+        self._deltaArrays = None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._basePositions) + len(self._delta)
+
+    def __contains__(self, ref:any) -> bool:
+        with self._lock:
+            return ref in self._delta or ref in self._basePositions
+
+    def insert(self, geom:BaseGeometry, ref:any = None):
+        """
+        Insert a geometry in the index.
+
+        :param geom: the geometry to insert.
+        :param ref: the reference of the geometry, which has to be unique in the index.
+        """
+        ref = geom if ref is None else ref
+        with self._lock:
+            self._insert(geom, ref)
+            if self._pendingEdits is not None:
+                self._pendingEdits.append((geom, ref))
+            self._checkRebuild()
+
+    def remove(self, ref:any):
+        """
+        Remove a geometry from the index.
+
+        :param ref: the reference of the geometry to remove (or the geometry if no reference was used).
+        """
+        with self._lock:
+            self._remove(ref)
+            if self._pendingEdits is not None:
+                self._pendingEdits.append((None, ref))
+            self._checkRebuild()
+
+    def _insert(self, geom:BaseGeometry, ref:any):
+        if ref in self._delta or ref in self._basePositions:
+            raise Exception(f"The reference {ref} is already in the index.")
+        self._delta[ref] = geom
+        self._deltaArrays = None
+
+    def _remove(self, ref:any):
+        if ref in self._delta:
+            del self._delta[ref]
+            self._deltaArrays = None
+        elif ref in self._basePositions:
+            self._baseAlive[self._basePositions.pop(ref)] = False
+            self._tombstones += 1
+        else:
+            raise Exception(f"The reference {ref} is not in the index.")
+
+    def _checkRebuild(self):
+        if self._rebuildThread is None and len(self._delta) + self._tombstones >= self.rebuildThreshold:
+            self.rebuild(wait=not self.background)
+
+    def rebuild(self, wait:bool = True):
+        """
+        Rebuild the static tree with the current content, emptying the buffer and the tombstones.
+
+        :param wait: if True, rebuild in the calling thread (after a running background
+                    rebuild is done), else run it in a background thread.
+        """
+        if wait:
+            self.waitForRebuild()
+        with self._lock:
+            if self._rebuildThread is not None:
+                return
+            alive = self._baseAlive
+            geoms = self._baseGeoms[alive].tolist() + list(self._delta.values())
+            refs = [ref for ref, isAlive in zip(self._baseRefs, alive.tolist()) if isAlive] + list(self._delta.keys())
+            if wait:
+                # the lock is held for the whole rebuild, so no edit can happen meanwhile
+                self._rebuild(geoms, refs)
+                return
+            self._pendingEdits = []
+            thread = threading.Thread(target=self._rebuild, args=(geoms, refs), name="HyDynamicSTRTreeIndex-rebuild", daemon=True)
+            self._rebuildThread = thread
+            thread.start()
+
+    def _rebuild(self, geoms:list, refs:list):
+        try:
+            rebuilt = HyDynamicSTRTreeIndex(geoms, refs)
+            with self._lock:
+                self._baseIndex = rebuilt._baseIndex
+                self._baseGeoms = rebuilt._baseGeoms
+                self._baseRefs = rebuilt._baseRefs
+                self._basePositions = rebuilt._basePositions
+                self._baseAlive = rebuilt._baseAlive
+                self._tombstones = 0
+                self._delta = {}
+                self._deltaArrays = None
+                for geom, ref in self._pendingEdits or []:
+                    if geom is None:
+                        self._remove(ref)
+                    else:
+                        self._insert(geom, ref)
+        finally:
+            with self._lock:
+                self._pendingEdits = None
+                self._rebuildThread = None
+
+    def waitForRebuild(self):
+        """
+        Wait for a running background rebuild to finish.
+        """
+        thread = self._rebuildThread
+        if thread is not None:
+            thread.join()
+
+    def _state(self) -> tuple:
+        """
+        Get a consistent view of the index to query without holding the lock.
+        """
+        with self._lock:
+            if self._deltaArrays is None:
+                geoms = np.fromiter(self._delta.values(), dtype=object, count=len(self._delta))
+                refs = np.empty(len(self._delta), dtype=object)
+                refs[:] = list(self._delta.keys())
+                self._deltaArrays = (geoms, refs, shapely.envelope(geoms))
+            # the alive flags are edited in place, so copy them
+            return self._baseIndex, self._baseRefs, self._baseAlive.copy(), self._deltaArrays
+
+    def query(self, geom:BaseGeometry) -> list:
+        """
+        Query the spatial index for bounding box intersecting geometries.
+
+        :param geom: the geometry to query for.
+
+        :return: a list of the references of the intersecting geometries.
+        """
+        baseIndex, baseRefs, baseAlive, (deltaGeoms, deltaRefs, deltaEnvelopes) = self._state()
+        indexes = baseIndex.index.query(geom)
+        result = [baseRefs[i] for i in indexes[baseAlive[indexes]]]
+        if len(deltaGeoms) > 0:
+            result.extend(deltaRefs[shapely.intersects(deltaEnvelopes, shapely.envelope(geom))].tolist())
+        return result
+
+    def queryNearest(self, geom:BaseGeometry, maxDistance:float = None) -> any:
+        """
+        Query the spatial index for the nearest geometry to a given geometry.
+
+        :param geom: the geometry to query for.
+        :param maxDistance: the maximum distance to search for.
+
+        :return: the reference of the nearest geometry or none.
+        """
+        baseIndex, baseRefs, baseAlive, (deltaGeoms, deltaRefs, _) = self._state()
+        nearest = None
+        nearestDistance = np.inf
+        if len(baseRefs) > 0:
+            # widen the search until a geometry that was not removed is found
+            k = 1
+            while True:
+                _, treeIndexes, distances = baseIndex.queryNearestBulk([geom], k=k, maxDistance=maxDistance, returnDistance=True, returnIndexes=True)
+                alive = baseAlive[treeIndexes]
+                if alive.any():
+                    first = np.argmax(alive)
+                    nearest = baseRefs[treeIndexes[first]]
+                    nearestDistance = distances[first]
+                    break
+                if len(treeIndexes) < k:
+                    break
+                k *= 2
+        if len(deltaGeoms) > 0:
+            distances = shapely.distance(geom, deltaGeoms)
+            first = np.argmin(distances)
+            if distances[first] < nearestDistance and (maxDistance is None or distances[first] <= maxDistance):
+                nearest = deltaRefs[first]
+        return nearest
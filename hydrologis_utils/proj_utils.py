@@ -1,8 +1,10 @@
 
 import pyproj
+import numpy as np
+import shapely
 from shapely.ops import transform as shpTransform
 from shapely.geometry.base import BaseGeometry
-from hydrologis_utils.geom_utils import ExtendedGeometry
+from hydrologis_utils.geom_utils import ExtendedGeometry, ExtendedGeometryArray
 
 class HyProjManager():
 
@@ -25,4 +27,18 @@ class HyProjManager():
         transformedGeom = ExtendedGeometry(transformedGeom)
         transformedGeom.set_srid(self.destinationEpsg)
         return transformedGeom
-        
\ No newline at end of file
+
+    def transformArray(self, geoms:np.ndarray) -> np.ndarray:
+        """
+        Transform all the geometries of an array with a single call to the transformer.
+        """
+        def _transformCoords(coords):
+            return np.column_stack(self.transformation(*coords.T))
+        includeZ = bool(np.any(shapely.has_z(geoms)))
+        return shapely.transform(geoms, _transformCoords, include_z=includeZ)
+
+    def transformExtendedArray(self, extGeoms:ExtendedGeometryArray) -> ExtendedGeometryArray:
+        transformedGeoms = self.transformArray(extGeoms.get_basegeometries())
+        transformedGeoms = ExtendedGeometryArray(transformedGeoms, extGeoms.attributes, extGeoms.attributeName)
+        transformedGeoms.set_srid(self.destinationEpsg)
+        return transformedGeoms
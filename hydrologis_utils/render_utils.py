@@ -5,6 +5,7 @@ from math import ceil, floor
 from typing import List, Optional, Tuple
 
 import requests
+import shapely
 from PIL import Image, ImageDraw
 from requests.adapters import HTTPAdapter, Retry
 from shapely.affinity import affine_transform
@@ -12,7 +13,7 @@ from shapely.geometry import Point, Polygon, box
 from shapely.geometry.base import BaseGeometry
 
 from hydrologis_utils.color_utils import HyColor
-from hydrologis_utils.geom_utils import ExtendedGeometry, HyGeomUtils
+from hydrologis_utils.geom_utils import ExtendedGeometry, ExtendedGeometryArray, HyGeomUtils
 
 
 class HyStyle():
@@ -385,7 +386,7 @@ class HyGeomRenderer():
         Render the geometries on an image.
 
         :param imagesBoundsLongLat: the bounds of the image in long lat as a list of [xmin, ymin, xmax, ymax]
-        :param geometriesLongLat: the geometries to render in long lat (this can be an ExtendedGeometry, in case theming with colorTable is used)
+        :param geometriesLongLat: the geometries to render in long lat (this can be an ExtendedGeometry, in case theming with colorTable is used, or an ExtendedGeometryArray)
         :param colorTable: a dictionary of attribute values and styles to use for theming (the attribute comes from the ExtendedGeometry)
         :param antialias: if True, the image will be rendered with antialiasing (this is a workaround at the moment, rendering is made at double size and then resized)
         :param intersectionBufferX: a buffer to use to enlarge the tile bounds in x direction (useful when rendering points, that need to have partials included from the side tile)
@@ -405,6 +406,10 @@ class HyGeomRenderer():
         # Create a drawing object
         draw = ImageDraw.Draw(image)
 
+        if isinstance(geometriesLongLat, ExtendedGeometryArray):
+            # filter the whole array at once, the loop then only sees what is in the tile
+            geometriesLongLat = geometriesLongLat.filter(shapely.intersects(geometriesLongLat.geoms, tile_box))
+
         for geom in geometriesLongLat:
             if isinstance(geom, ExtendedGeometry):
                 attribute = geom.attribute
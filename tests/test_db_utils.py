@@ -1,11 +1,14 @@
+import threading
 from hydrologis_utils.db_utils import *
 
-from sqlalchemy import Table, Column, Integer, String, MetaData, select
+from sqlalchemy import Table, Column, Integer, String, LargeBinary, MetaData, select
 from geoalchemy2 import Geometry
 from geoalchemy2.shape import from_shape, to_shape
 from sqlalchemy.sql import text
 import shapely.wkb as wkb
 import tempfile
+import numpy as np
+from shapely.geometry import Point
 
 
 
@@ -276,6 +279,144 @@ class TestDbUtils(unittest.TestCase):
         os.remove(dbPath)
 
 
+    def test_table_sample(self):
+        table_name = 'sampled'
+        test_table = Table(table_name, self.metadata,
+            Column('id', Integer, primary_key=True),
+            Column('value', Integer)
+        )
+        self.db.createTable(test_table)
+        self.db.insertOrmWithParams(test_table, [{'value': i} for i in range(1000)])
+
+        rows = self.db.getTableSample(table_name, n=50, seed=1)
+        self.assertEqual(len(rows), 50)
+        self.assertEqual(len(set(row[0] for row in rows)), 50)
+        self.assertEqual(rows, self.db.getTableSample(table_name, n=50, seed=1))
+
+        # with gaps in the rowids n is still honoured
+        self.db.insertSqlWithParams(f"DELETE FROM {table_name} WHERE id % 2 = 0", {})
+        rows = self.db.getTableSample(table_name, n=100, seed=2)
+        self.assertEqual(len(rows), 100)
+
+        sample = self.db.getTableSample(table_name, fraction=0.2, seed=3, columnar=True)
+        self.assertEqual(set(sample.keys()), {'id', 'value'})
+        self.assertTrue(50 < len(sample['id']) < 150)
+        self.assertTrue(np.all(sample['id'] % 2 == 1))
+
+        with self.assertRaises(Exception):
+            self.db.getTableSample(table_name)
+
+    def test_table_stats(self):
+        table_name = 'stats'
+        test_table = Table(table_name, self.metadata,
+            Column('id', Integer, primary_key=True),
+            Column('name', String),
+            Column('value', Integer),
+            Column('geom', LargeBinary)
+        )
+        self.db.createTable(test_table)
+        data = [{'name': f"n{i % 10}", 'value': None if i % 4 == 0 else i, 'geom': wkb.dumps(Point(i, -i))} for i in range(1000)]
+        self.db.insertOrmWithParams(test_table, data)
+
+        stats = self.db.getTableStats(table_name, geometryColumn="geom", chunk_size=128)
+        self.assertEqual(stats["count"], 1000)
+        self.assertEqual(stats["extent"], [0, -999, 999, 0])
+
+        valueStats = stats["columns"]["value"]
+        self.assertEqual(valueStats["nulls"], 250)
+        self.assertEqual(valueStats["count"], 750)
+        self.assertEqual(valueStats["min"], 1)
+        self.assertEqual(valueStats["max"], 999)
+        self.assertTrue(abs(valueStats["distinct"] - 750) < 20)
+
+        nameStats = stats["columns"]["name"]
+        self.assertEqual(nameStats["min"], "n0")
+        self.assertEqual(nameStats["max"], "n9")
+        self.assertEqual(nameStats["distinct"], 10)
+
+        stats = self.db.getTableStats(table_name, columns=["id"])
+        self.assertEqual(list(stats["columns"].keys()), ["id"])
+        self.assertIsNone(stats["extent"])
+
+    def test_hyperloglog(self):
+        hll = HyperLogLog()
+        for i in range(10):
+            hll.add(np.arange(i * 10000, (i + 1) * 10000))
+            hll.add(np.arange(0, 5000))
+        self.assertTrue(abs(hll.count() - 100000) / 100000 < 0.03)
+
+        hll = HyperLogLog()
+        hll.add([f"value {i % 300}" for i in range(10000)])
+        self.assertTrue(abs(hll.count() - 300) < 10)
+
+    def test_mirror_table(self):
+        tmp_dir = tempfile.gettempdir()
+        dbPath = os.path.join(tmp_dir, "test_mirror_source.sqlite")
+        if os.path.exists(dbPath):
+            os.remove(dbPath)
+        sourceDb = SqliteDb(DbType.SQLITE.url(dbname=dbPath), echo=False)
+
+        table_name = "gauges"
+        table = Table(table_name, self.metadata,
+            Column('id', Integer, primary_key=True),
+            Column('name', String),
+            Column('updated', Integer),
+            Column('geom', LargeBinary)
+        )
+        sourceDb.createTable(table)
+        sql = f"INSERT INTO {table_name} (id, name, updated, geom) VALUES (:id, :name, :updated, :geom)"
+        data = [{"id": i, "name": f"g{i}", "updated": i, "geom": wkb.dumps(Point(i, i))} for i in range(100)]
+        sourceDb.insertSqlWithParams(sql, data)
+
+        mirror = mirrorTable(sourceDb, table_name, where="id < 50", updatedColumn="updated",
+                             indexColumns=["name"], spatialIndex=True, geometryColumn="geom")
+        self.assertEqual(mirror.getRecordCount(table_name), 50)
+        rows = mirror.getTableData(table_name, where="name='g10'")
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(wkb.loads(rows[0][3]), Point(10, 10))
+
+        rtree = mirror.getRtreeName()
+        result = mirror.execute(f"select id from {rtree} where minx >= 4.5 and maxx <= 7.5 and miny >= 4.5 and maxy <= 7.5")
+        self.assertEqual(len(result.fetchall()), 3)
+
+        # incremental refresh only picks up newer rows (and the ones with the last seen value)
+        insertSql = f"INSERT INTO {table_name} (id, name, updated, geom) VALUES (:id, :name, :updated, :geom)"
+        sourceDb.insertSqlWithParams(insertSql, {"id": -1, "name": "new", "updated": 100, "geom": wkb.dumps(Point(-1, -1))})
+        with sourceDb.connect() as conn:
+            conn.exec_driver_sql(f"UPDATE {table_name} SET name='changed', updated=100 WHERE id=10")
+            conn.exec_driver_sql(f"UPDATE {table_name} SET name='ignored' WHERE id=11")
+            conn.commit()
+        count = mirror.refresh(force=True)
+        self.assertEqual(count, 3)
+        self.assertEqual(mirror.getRecordCount(table_name), 51)
+        self.assertEqual(len(mirror.getTableData(table_name, where="name='changed'")), 1)
+        self.assertEqual(len(mirror.getTableData(table_name, where="name='ignored'")), 0)
+        result = mirror.execute(f"select count(*) from {rtree}")
+        self.assertEqual(result.first()[0], 51)
+
+        # a row committed later with the same updated value is not lost
+        sourceDb.insertSqlWithParams(insertSql, {"id": -2, "name": "late", "updated": 100, "geom": wkb.dumps(Point(-2, -2))})
+        mirror.refresh(force=True)
+        self.assertEqual(len(mirror.getTableData(table_name, where="name='late'")), 1)
+
+        # readers in other threads never see a full reload in progress
+        fullMirror = mirrorTable(sourceDb, table_name, chunk_size=10)
+        counts = []
+        def read():
+            for _ in range(20):
+                counts.append(fullMirror.getRecordCount(table_name))
+        readers = [threading.Thread(target=read) for _ in range(3)]
+        for reader in readers:
+            reader.start()
+        for _ in range(5):
+            fullMirror.refresh(force=True)
+        for reader in readers:
+            reader.join()
+        self.assertEqual(set(counts), {102})
+
+        sourceDb.engine.dispose()
+        os.remove(dbPath)
+
 
   
 
@@ -1,10 +1,19 @@
-from hydrologis_utils.geom_utils import HyGeomUtils, HySTRTreeIndex
+from hydrologis_utils.geom_utils import HyGeomUtils, HySTRTreeIndex, HyDynamicSTRTreeIndex, ExtendedGeometry, ExtendedGeometryArray
 from shapely.affinity import affine_transform
+from shapely.ops import transform
+import numpy as np
+import shapely
+import tempfile
+import time
+import warnings
 from shapely.geometry import GeometryCollection, LineString, MultiLineString, MultiPoint, MultiPolygon, Point, Polygon
 import unittest
 
 # run with python3 -m unittest discover tests/
 
+# size of the benchmark datasets, kept small to not slow down the test suite
+BENCHMARK_SIZE = 100000
+
 class TestGeomutils(unittest.TestCase):
     
     # test fromWkt and toWkt methods
@@ -50,6 +59,110 @@ class TestGeomutils(unittest.TestCase):
         self.assertEqual(extGeom.get_srid(), 4326)
 
 
+    def test_array_geom_creation(self):
+        coords = np.array([[0, 0], [1, 0], [1, 1], [0, 1], [5, 5], [6, 5], [6, 6]], dtype=float)
+
+        points = HyGeomUtils.makePoints(coords, srid=4326)
+        self.assertEqual(len(points), 7)
+        self.assertEqual(points[4], Point(5, 5))
+        self.assertTrue(np.all(shapely.get_srid(points) == 4326))
+
+        lines = HyGeomUtils.makeLineStrings(coords, offsets=[0, 4, 7])
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(lines[1], LineString([[5, 5], [6, 5], [6, 6]]))
+        lines2 = HyGeomUtils.makeLineStrings(coords, indices=[0, 0, 0, 0, 1, 1, 1])
+        self.assertTrue(np.all(shapely.equals(lines, lines2)))
+
+        polygons = HyGeomUtils.makePolygons(coords, offsets=[0, 4, 7], srid=32632)
+        self.assertEqual(polygons[0], Polygon([[0, 0], [1, 0], [1, 1], [0, 1]]))
+        self.assertEqual(polygons[1].area, 0.5)
+        self.assertEqual(shapely.get_srid(polygons[1]), 32632)
+
+        shellAndHole = np.array([[0, 0], [10, 0], [10, 10], [0, 10], [2, 2], [4, 2], [4, 4], [2, 4]], dtype=float)
+        polygons = HyGeomUtils.makePolygons(shellAndHole, offsets=[0, 4, 8], polygonIndices=[0, 0])
+        self.assertEqual(len(polygons), 1)
+        self.assertEqual(polygons[0].area, 96)
+
+        with self.assertRaises(Exception):
+            HyGeomUtils.makeLineStrings(coords)
+
+    def test_array_geom_creation_benchmark(self):
+        rng = np.random.default_rng(0)
+        coords = rng.random((BENCHMARK_SIZE * 4, 2)) * 1000
+        coordsList = coords.tolist()
+
+        t0 = time.perf_counter()
+        scalarLines = [HyGeomUtils.makeLineString(coordsList[i:i + 4], srid=4326) for i in range(0, len(coordsList), 4)]
+        t1 = time.perf_counter()
+        lines = HyGeomUtils.makeLineStrings(coords, offsets=np.arange(0, len(coords) + 1, 4), srid=4326)
+        t2 = time.perf_counter()
+        print(f"makeLineString: {t1 - t0:.3f}s, makeLineStrings: {t2 - t1:.3f}s for {BENCHMARK_SIZE} lines")
+
+        self.assertEqual(len(lines), len(scalarLines))
+        self.assertTrue(shapely.equals(lines[-1], scalarLines[-1]))
+        self.assertLess(t2 - t1, t1 - t0)
+
+    def test_extended_array(self):
+        squares = HyGeomUtils.makePolygons(
+            np.array([[0, 0], [2, 0], [2, 2], [0, 2], [10, 10], [11, 10], [11, 11], [10, 11]], dtype=float),
+            offsets=[0, 4, 8], srid=4326)
+        extArray = ExtendedGeometryArray(squares, {"name": ["big", "small"], "value": [1.5, 2.5]})
+        self.assertEqual(len(extArray), 2)
+        self.assertEqual(extArray.get_area().tolist(), [4, 1])
+        self.assertEqual(extArray.get_length().tolist(), [8, 4])
+        self.assertEqual(extArray.get_bounds()[1].tolist(), [10, 10, 11, 11])
+        self.assertEqual(extArray.get_total_bounds().tolist(), [0, 0, 11, 11])
+        self.assertEqual(extArray.get_centroid().geoms[0], Point(1, 1))
+        self.assertEqual(extArray.get_srid().tolist(), [4326, 4326])
+        extArray.set_srid(32632)
+        self.assertEqual(extArray.get_srid().tolist(), [32632, 32632])
+
+        buffered = extArray.buffer(1)
+        self.assertTrue(np.all(buffered.get_area() > extArray.get_area()))
+        self.assertEqual(buffered.get_attribute("name").tolist(), ["big", "small"])
+
+        rotated = extArray.rotate(90)
+        self.assertLess(shapely.hausdorff_distance(rotated.geoms[0], squares[0]), 1e-9)
+        rotated = extArray.rotate(90, origin=Point(0, 0))
+        self.assertTrue(np.allclose(rotated.get_bounds()[0], [-2, 0, 0, 2]))
+
+        clipped = extArray.get_intersection(HyGeomUtils.fromWkt("POLYGON ((1 1, 20 1, 20 20, 1 20, 1 1))"))
+        self.assertEqual(clipped.get_area().tolist(), [1, 1])
+
+        # item access, slicing and filtering
+        item = extArray[1]
+        self.assertIsInstance(item, ExtendedGeometry)
+        self.assertEqual(item.attribute, "small")
+        self.assertEqual(item.get_area(), 1)
+        filtered = extArray.filter(extArray.get_attribute("value") > 2)
+        self.assertEqual(len(filtered), 1)
+        self.assertEqual(filtered.get_attribute().tolist(), ["small"])
+        self.assertEqual(len(extArray[:1]), 1)
+        self.assertEqual([g.attribute for g in extArray], ["big", "small"])
+
+        fromList = ExtendedGeometryArray.fromExtendedGeometries([ExtendedGeometry(Point(1, 1), 3), ExtendedGeometry(Point(2, 2), 4)])
+        self.assertEqual(fromList.get_attribute().tolist(), [3, 4])
+
+        # object attributes: None, dicts and tuples stay single values
+        fromList = ExtendedGeometryArray.fromExtendedGeometries([ExtendedGeometry(Point(1, 1), 1), ExtendedGeometry(Point(2, 2), None)])
+        self.assertEqual(fromList[0].attribute, 1)
+        self.assertIsNone(fromList[-1].attribute)
+        objects = ExtendedGeometryArray(squares, {"info": [{"a": 1}, {"b": 2}], "pair": [(1, 2), (3, 4)]})
+        self.assertEqual(objects.get_attribute("pair").shape, (2,))
+        self.assertEqual(objects[1].attribute, {"b": 2})
+        self.assertEqual(objects[-1].attribute, {"b": 2})
+        objects.attributeName = "pair"
+        self.assertEqual(objects[0].attribute, (1, 2))
+        self.assertEqual(HySTRTreeIndex(objects).queryNearest(Point(12, 12)).attribute, (3, 4))
+
+        # the spatial index returns the ExtendedGeometry items
+        index = HySTRTreeIndex(extArray)
+        result = index.query(Point(10.5, 10.5))
+        self.assertEqual(result[0].attribute, "small")
+
+        with self.assertRaises(AttributeError):
+            ExtendedGeometry(Point(1, 1)).other = 1
+
     def test_geom_2d(self):
         # create a 3d Linestring wkt
         wkt = "LINESTRING Z (30 10 1, 10 30 2, 40 40 3)"
@@ -63,6 +176,67 @@ class TestGeomutils(unittest.TestCase):
 
         self.assertEqual(geom2D, geom2Dexp)
 
+    def test_geom_dimensions(self):
+        geoms = np.array([
+            HyGeomUtils.fromWkt("LINESTRING (0 0, 1 1)"),
+            HyGeomUtils.fromWkt("LINESTRING Z (0 0 7, 1 1 8)"),
+            HyGeomUtils.fromWkt("POINT ZM (1 2 3 4)"),
+        ])
+        geoms2D = HyGeomUtils.force2D(geoms)
+        self.assertFalse(np.any(shapely.has_z(geoms2D)))
+        self.assertEqual(geoms2D[2], Point(1, 2))
+
+        geoms3D = HyGeomUtils.force3D(geoms, 5)
+        self.assertTrue(np.all(shapely.has_z(geoms3D)))
+        self.assertEqual(shapely.get_coordinates(geoms3D, include_z=True)[:, 2].tolist(), [5, 5, 7, 8, 3])
+
+        geoms3D = HyGeomUtils.force3D(geoms, np.array([1, 2, 3, 4, 5]))
+        self.assertEqual(shapely.get_coordinates(geoms3D, include_z=True)[:, 2].tolist(), [1, 2, 3, 4, 5])
+
+        # z from a "dem" function
+        geoms3D = HyGeomUtils.force3D(geoms, lambda xy: xy[:, 0] + xy[:, 1])
+        self.assertEqual(shapely.get_coordinates(geoms3D, include_z=True)[:, 2].tolist(), [0, 2, 0, 2, 3])
+
+        with self.assertRaises(Exception):
+            HyGeomUtils.force3D(geoms, np.array([1, 2]))
+
+        noM = HyGeomUtils.dropM(geoms)
+        self.assertTrue(shapely.equals(noM[2], Point(1, 2, 3)))
+        self.assertTrue(shapely.has_z(noM[2]))
+
+        extGeoms = [HyGeomUtils.makePoint([1, 2], extended=True), HyGeomUtils.makePoint([3, 4], extended=True)]
+        extGeoms[0].attribute = "a"
+        ext3D = HyGeomUtils.force3D(extGeoms, 1.0)
+        self.assertEqual(ext3D[0].attribute, "a")
+        self.assertTrue(ext3D[1].get_basegeometry().has_z)
+
+        extArray3D = HyGeomUtils.force3D(ExtendedGeometryArray(geoms, {"id": [1, 2, 3]}), 1.0)
+        self.assertIsInstance(extArray3D, ExtendedGeometryArray)
+        self.assertEqual(extArray3D.get_attribute().tolist(), [1, 2, 3])
+
+    def test_geom_dimensions_benchmark(self):
+        # a network of lines with a million vertices
+        rng = np.random.default_rng(0)
+        vertices = BENCHMARK_SIZE * 10
+        coords = rng.random((vertices, 3)) * 1000
+        network = HyGeomUtils.makeLineStrings(coords, offsets=np.arange(0, vertices + 1, 100))
+
+        with warnings.catch_warnings():
+            # shapely.ops.transform is deprecated, but it is the per geometry baseline
+            warnings.simplefilter("ignore", DeprecationWarning)
+            t0 = time.perf_counter()
+            scalar2D = [transform(lambda x, y, z=None: (x, y), line) for line in network]
+            t1 = time.perf_counter()
+        network2D = HyGeomUtils.force2D(network)
+        t2 = time.perf_counter()
+        network3D = HyGeomUtils.force3D(network2D, lambda xy: xy[:, 0] * 0.1)
+        t3 = time.perf_counter()
+        print(f"per line transform 2D: {t1 - t0:.3f}s, force2D: {t2 - t1:.3f}s, force3D from function: {t3 - t2:.3f}s for {vertices} vertices")
+
+        self.assertTrue(shapely.equals(network2D[0], scalar2D[0]))
+        self.assertEqual(len(shapely.get_coordinates(network3D, include_z=True)), vertices)
+        self.assertLess(t2 - t1, t1 - t0)
+
     def test_split_line(self):
         wkt = "LINESTRING (0 0, 10 0, 10 10, 18 10)"
         geom = HyGeomUtils.fromWkt(wkt)
@@ -85,6 +259,50 @@ class TestGeomutils(unittest.TestCase):
 
         
 
+
+    def test_split_lines_vectorized(self):
+        lines = [
+            HyGeomUtils.fromWkt("LINESTRING (0 0, 10 0, 10 10, 18 10)"),
+            HyGeomUtils.fromWkt("LINESTRING (0 0, 2 0)"),
+            HyGeomUtils.fromWkt("LINESTRING Z (0 0 0, 0 12 12)"),
+        ]
+        segments, sourceIndexes = HyGeomUtils.splitLinesEquidistant(lines, 5)
+        self.assertEqual(sourceIndexes.tolist(), [0] * 6 + [1] + [2] * 3)
+        self.assertTrue(np.allclose(shapely.length(segments), [5, 5, 5, 5, 5, 3, 2, 5, 5, 2]))
+        self.assertEqual(segments[2], LineString([[10, 0], [10, 5]]))
+        self.assertEqual(segments[4], LineString([[10, 10], [15, 10]]))
+        self.assertTrue(np.allclose(shapely.get_coordinates(segments[8], include_z=True), [[0, 5, 5], [0, 10, 10]]))
+
+        # pieces join back to the source lines
+        for i, line in enumerate(lines):
+            merged = shapely.line_merge(shapely.multilinestrings(segments[sourceIndexes == i]))
+            self.assertTrue(shapely.equals(merged, line))
+
+        # same results as the per line walk on a long random line
+        rng = np.random.default_rng(0)
+        line = LineString(np.cumsum(rng.random((BENCHMARK_SIZE, 2)) - 0.3, axis=0))
+        segments, _ = HyGeomUtils.splitLinesEquidistant(line, 7.5)
+        self.assertEqual(len(segments), int(np.ceil(line.length / 7.5)))
+        self.assertTrue(np.allclose(shapely.length(segments[:-1]), 7.5))
+        self.assertAlmostEqual(shapely.length(segments).sum(), line.length, places=6)
+
+        # lengths that are a multiple of the spacing up to rounding
+        self.assertEqual(len(HyGeomUtils.splitLineEquidistant(LineString([(7.3, 8), (6.1, 8)]), 0.2)), 6)
+
+        # random multi line inputs with non integer spacings
+        for spacing in [1 / 3, 0.2, 0.7, 2.5]:
+            for _ in range(20):
+                lines = [LineString(rng.integers(0, 10, (rng.integers(2, 6), 2)).astype(float) + rng.random() * 0.1) for _ in range(rng.integers(1, 8))]
+                lines = [line for line in lines if line.length > 0]
+                if not lines:
+                    continue
+                segments, sourceIndexes = HyGeomUtils.splitLinesEquidistant(lines, spacing)
+                self.assertFalse(np.any(shapely.is_empty(segments)))
+                for i, line in enumerate(lines):
+                    pieces = shapely.length(segments[sourceIndexes == i])
+                    self.assertAlmostEqual(pieces.sum(), line.length, places=9)
+                    self.assertTrue(np.allclose(pieces[:-1], spacing))
+                    self.assertTrue(0 < pieces[-1] <= spacing + 1e-9)
         
     # test joinLines method
     def test_join_lines(self):
@@ -170,6 +388,138 @@ class TestGeomutils(unittest.TestCase):
         ref = index.queryNearest(line)
         self.assertEqual(ref, 3)
 
+    def test_spatial_index_bulk(self):
+        polygons = [
+            HyGeomUtils.fromWkt("POLYGON ((0 0, 10 0, 10 10, 0 10, 0 0))"),
+            HyGeomUtils.fromWkt("POLYGON ((20 0, 30 0, 30 10, 20 10, 20 0))"),
+            HyGeomUtils.fromWkt("POLYGON ((0 20, 10 20, 0 30, 0 20))"),
+        ]
+        points = HyGeomUtils.makePoints(np.array([[5, 5], [25, 5], [9, 29], [15, 5]], dtype=float))
+
+        index = HySTRTreeIndex(polygons, ["a", "b", "c"])
+        inputIndexes, refs = index.queryBulk(points, predicate="within")
+        self.assertEqual(inputIndexes.tolist(), [0, 1])
+        self.assertEqual(refs.tolist(), ["a", "b"])
+
+        # the bounding box of the triangle contains the point, the triangle doesn't
+        inputIndexes, refs = index.queryBulk(points, predicate=None)
+        self.assertEqual(refs.tolist(), ["a", "b", "c"])
+
+        inputIndexes, treeIndexes = index.queryBulk(points, predicate="dwithin", distance=6, returnIndexes=True)
+        self.assertEqual(list(zip(inputIndexes.tolist(), treeIndexes.tolist())), [(0, 0), (1, 1), (2, 2), (3, 0), (3, 1)])
+
+        inputIndexes, refs, distances = index.queryNearestBulk(points, returnDistance=True)
+        self.assertEqual(inputIndexes.tolist(), [0, 1, 2, 3])
+        self.assertEqual(refs.tolist(), ["a", "b", "c", "a"])
+        self.assertEqual(distances[0], 0)
+
+        inputIndexes, refs = index.queryNearestBulk(points, k=2, maxDistance=8)
+        self.assertEqual(list(zip(inputIndexes.tolist(), refs.tolist())), [(0, "a"), (1, "b"), (2, "c"), (3, "a"), (3, "b")])
+
+        # k nearest against brute force
+        rng = np.random.default_rng(1)
+        treePoints = HyGeomUtils.makePoints(rng.random((2000, 2)) * 100)
+        queryPoints = HyGeomUtils.makePoints(rng.random((50, 2)) * 100)
+        index = HySTRTreeIndex(treePoints)
+        inputIndexes, geoms, distances = index.queryNearestBulk(queryPoints, k=5, returnDistance=True)
+        allDistances = shapely.distance(queryPoints[:, None], treePoints[None, :])
+        for i in range(len(queryPoints)):
+            self.assertTrue(np.allclose(np.sort(allDistances[i])[:5], distances[inputIndexes == i]))
+        self.assertTrue(np.allclose(shapely.distance(queryPoints[inputIndexes], geoms), distances))
+
+    def test_spatial_index_snapshot(self):
+        rng = np.random.default_rng(2)
+        centers = rng.random((500, 2)) * 100
+        polygons = shapely.buffer(HyGeomUtils.makePoints(centers), rng.random(500) * 3 + 0.5, quad_segs=4)
+        polygons = shapely.set_srid(polygons, 32632)
+        references = [f"p{i}" for i in range(len(polygons))]
+        queryPoints = HyGeomUtils.makePoints(rng.random((100, 2)) * 100)
+        index = HySTRTreeIndex(polygons, references)
+
+        with tempfile.TemporaryDirectory() as folder:
+            contentHash = index.save(folder)
+            self.assertEqual(contentHash, HySTRTreeIndex.computeContentHash(polygons, references))
+            self.assertEqual(contentHash, HySTRTreeIndex.readSnapshotHash(folder))
+
+            loaded = HySTRTreeIndex.load(folder, expectedHash=contentHash, verify=True)
+            self.assertEqual(sorted(loaded.query(queryPoints[0])), sorted(index.query(queryPoints[0])))
+            for predicate, distance in [("intersects", None), ("within", None), ("dwithin", 2.0)]:
+                expected = index.queryBulk(queryPoints, predicate=predicate, distance=distance)
+                result = loaded.queryBulk(queryPoints, predicate=predicate, distance=distance)
+                self.assertEqual(set(zip(*[r.tolist() for r in result])), set(zip(*[e.tolist() for e in expected])))
+
+            expected = index.queryNearestBulk(queryPoints, k=3, returnDistance=True)
+            result = loaded.queryNearestBulk(queryPoints, k=3, returnDistance=True)
+            self.assertEqual(result[0].tolist(), expected[0].tolist())
+            self.assertTrue(np.allclose(result[2], expected[2]))
+            self.assertEqual(loaded.queryNearest(queryPoints[1], maxDistance=5), index.queryNearest(queryPoints[1], maxDistance=5))
+
+            # geometries are decoded with their srid
+            geom = loaded.geomList.getGeometries(np.array([0]))[0]
+            self.assertTrue(geom.equals(polygons[0]))
+            self.assertEqual(shapely.get_srid(geom), 32632)
+
+            with self.assertRaises(Exception):
+                HySTRTreeIndex.load(folder, expectedHash="stale")
+
+        extended = ExtendedGeometryArray(polygons[:10], {"name": np.array(references[:10])})
+        with tempfile.TemporaryDirectory() as folder:
+            HySTRTreeIndex(extended).save(folder)
+            loaded = HySTRTreeIndex.load(folder)
+            item = loaded.queryNearest(shapely.centroid(polygons[3]))
+            self.assertTrue(isinstance(item, ExtendedGeometry))
+            self.assertEqual(item.attribute, "p3")
+
+    def test_dynamic_spatial_index(self):
+        points = [Point(x, 0) for x in range(10)]
+        index = HyDynamicSTRTreeIndex(points, [f"p{x}" for x in range(10)], rebuildThreshold=5, background=False)
+        self.assertEqual(sorted(index.query(Point(3, 0).buffer(1.5))), ["p2", "p3", "p4"])
+
+        index.remove("p3")
+        index.insert(Point(3.2, 0), "new")
+        self.assertEqual(sorted(index.query(Point(3, 0).buffer(1.5))), ["new", "p2", "p4"])
+        self.assertEqual(index.queryNearest(Point(3, 1)), "new")
+        index.remove("new")
+        self.assertEqual(index.queryNearest(Point(3.1, 1)), "p4")
+        self.assertIsNone(index.queryNearest(Point(3.1, 5), maxDistance=2))
+        with self.assertRaises(Exception):
+            index.remove("new")
+        with self.assertRaises(Exception):
+            index.insert(Point(0, 0), "p0")
+
+        # removing the nearest ones needs a wider search in the static tree
+        for x in [0, 1, 2, 4]:
+            index.remove(f"p{x}")
+        self.assertEqual(index.queryNearest(Point(0, 0)), "p5")
+        self.assertEqual(len(index), 5)
+
+        # continuous edits with background rebuilds
+        rng = np.random.default_rng(3)
+        index = HyDynamicSTRTreeIndex(rebuildThreshold=50)
+        expected = {}
+        for i in range(2000):
+            if expected and rng.random() < 0.3:
+                ref = list(expected)[rng.integers(len(expected))]
+                index.remove(ref)
+                del expected[ref]
+            else:
+                expected[i] = Point(rng.random(2) * 100)
+                index.insert(expected[i], i)
+        index.waitForRebuild()
+        self.assertEqual(len(index), len(expected))
+        queryGeom = Point(50, 50).buffer(20)
+        bruteForce = [ref for ref, geom in expected.items() if geom.intersects(queryGeom.envelope)]
+        self.assertEqual(sorted(index.query(queryGeom)), sorted(bruteForce))
+        nearest = min(expected, key=lambda ref: expected[ref].distance(Point(10, 10)))
+        self.assertEqual(index.queryNearest(Point(10, 10)), nearest)
+
+        # geometries are their own reference if none is given
+        index = HyDynamicSTRTreeIndex()
+        index.insert(points[0])
+        self.assertEqual(index.queryNearest(Point(1, 1)), points[0])
+        index.remove(points[0])
+        self.assertIsNone(index.queryNearest(Point(1, 1)))
+
     def test_transform_world_to_rectangle(self):
         world = (100, 1000, 200, 5000)
         rect = (0, 0, 100, 4000)
@@ -1,4 +1,4 @@
-from hydrologis_utils.geom_utils import HyGeomUtils
+from hydrologis_utils.geom_utils import HyGeomUtils, ExtendedGeometryArray
 from hydrologis_utils.proj_utils import HyProjManager
 
 import unittest
@@ -23,5 +23,16 @@ class TestProjtils(unittest.TestCase):
         line2 = pm.transform(line2)
         self.assertTrue(line2.equals_exact(line1, 0.000001))
 
+    def test_transform_array(self):
+        geoms = [HyGeomUtils.fromWkt("POINT (30 10)"), HyGeomUtils.fromWkt("LINESTRING (30 10, 10 30, 40 40)")]
+        extArray = ExtendedGeometryArray(geoms, {"id": [1, 2]})
+
+        pm = HyProjManager( 4326, 3857 )
+        transformed = pm.transformExtendedArray(extArray)
+        self.assertTrue(transformed.geoms[0].equals_exact(HyGeomUtils.fromWkt("POINT (3339584.723798207 1118889.9748579594)"), 0.000001))
+        self.assertTrue(transformed.geoms[1].equals_exact(pm.transform(geoms[1]), 0.000001))
+        self.assertEqual(transformed.get_srid().tolist(), [3857, 3857])
+        self.assertEqual(transformed.get_attribute().tolist(), [1, 2])
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
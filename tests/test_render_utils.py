@@ -1,7 +1,7 @@
 import sys
 sys.path.append("./")
 from hydrologis_utils.render_utils import HyGeomRenderer, HyStyle
-from hydrologis_utils.geom_utils import HyGeomUtils, ExtendedGeometry
+from hydrologis_utils.geom_utils import HyGeomUtils, ExtendedGeometry, ExtendedGeometryArray
 from hydrologis_utils.color_utils import HyColor
 from PIL import Image, ImageChops
 
@@ -55,6 +55,11 @@ class TestRenderUtils(unittest.TestCase):
         diff = ImageChops.difference(tileImage, Image.open(compareImage))
         self.assertIsNone(diff.getbbox())
 
+        extArray = ExtendedGeometryArray([geom1, geom2, HyGeomUtils.fromWkt("POINT (5000 5000)")], {"style": [1, 2, 1]})
+        tileImage = renderer.renderImage( tile_bounds, extArray, colorTable=colorTable)
+        diff = ImageChops.difference(tileImage, Image.open(compareImage))
+        self.assertIsNone(diff.getbbox())
+
 
     
     def test_line_tile(self):